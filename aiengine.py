@@ -3,119 +3,709 @@ import cv2
 import os
 import io
 import base64
+import binascii
 import numpy as np
 import csv
-import pandas as pd
 import time
-import subprocess
-from sklearn.preprocessing import LabelEncoder
-from sklearn.ensemble import RandomForestClassifier
 import re
-from collections import defaultdict
-from deepface import DeepFace
-import soundfile as sf
-import librosa
-from pydub import AudioSegment
+import copy
+import itertools
+import struct
+import uuid
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+# deepface (TensorFlow), pandas, scikit-learn, scipy, librosa, soundfile and
+# pydub are imported where they are first used, so importing this module
+# (and starting server.py) does not wait for them; warm_up() loads them
+from ollama_client import OllamaClient
+from recommendation_cache import RecommendationCache, context_key
+import metrics
 
 user_data = "user_logs.csv"
 OLLAMA_MODEL = "tinyllama" 
+OLLAMA_URL = os.environ.get("OLLAMA_HOST", "http://127.0.0.1:11434")
+# how long Ollama keeps the model loaded after a request
+OLLAMA_KEEP_ALIVE = os.environ.get("MOODFLIX_OLLAMA_KEEP_ALIVE", "30m")
+# hard limit in seconds for one LLM generation
+OLLAMA_TIMEOUT = float(os.environ.get("MOODFLIX_OLLAMA_TIMEOUT", "30"))
+NUM_RECOMMENDATIONS = 5
+RF_TREES = 50
+# trees added per warm-started retrain, and the size at which the forest
+# is rebuilt from scratch instead
+RF_WARM_START_TREES = 10
+RF_MAX_TREES = 150
+# how long an LLM answer is reused for an equivalent context
+LLM_CACHE_TTL = float(os.environ.get("MOODFLIX_LLM_CACHE_TTL", "1800"))
+LLM_CACHE_SIZE = 256
+MOVIE_TITLE_PATTERN = re.compile(r"\d+\.\s*(.*?)\s*\(\d{4}\)")
 CONFIDENCE_THRESHOLD = 0.50
 NUM_FRAMES = 10
+# frames whose difference hashes differ in at most this many bits are duplicates
+DUPLICATE_HASH_DISTANCE = 5
+# frames scored per model call while the mood is still undecided
+SMOOTHING_CHUNK_SIZE = 3
+# face results kept per client session, the half-life in seconds of their
+# weight, and the most weight (in confident frames) the session's earlier
+# evidence may add to a new request's tally
+EMOTION_HISTORY_SIZE = 64
+EMOTION_HALF_LIFE = float(os.environ.get("MOODFLIX_EMOTION_HALF_LIFE", "300"))
+EMOTION_PRIOR_WEIGHT = 3.0
+# most audio bytes one /inference/stream may collect before stream-done
+STREAM_AUDIO_MAX_BYTES = int(os.environ.get("MOODFLIX_STREAM_AUDIO_MAX_BYTES", str(16 * 1024 * 1024)))
+# threads used to decode, enhance and run face detection on frames
+FRAME_WORKERS = int(os.environ.get("MOODFLIX_FRAME_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+# "thread": face scoring and voice features run in this process; "process":
+# they run on the worker processes of inference_pool
+INFERENCE_BACKEND = os.environ.get("MOODFLIX_INFERENCE_BACKEND", "thread")
 
-emotion_history_with_confidence = []
+HAAR_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+# "track": detect on a downscaled frame, then search only around the last
+# face box (FaceTracker); "detect": full-resolution detection on every frame
+FACE_LOCALISATION = os.environ.get("MOODFLIX_FACE_LOCALISATION", "track")
+# scale of the copy a full detection runs on, frames between full
+# detections, and how far (in box sizes) around the last box is searched
+FACE_DETECT_SCALE = 0.5
+FACE_REDETECT_INTERVAL = 5
+FACE_SEARCH_MARGIN = 0.25
+FACE_MIN_SIZE = 60
 
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+# CLAHE objects keep internal buffers, so each frame worker thread builds
+# its own once and reuses it for every frame
+_thread_state = threading.local()
+# idle Haar cascades. Face localisation runs on short-lived handler threads
+# and a cascade takes ~20 ms to load, so cascades are borrowed from this
+# list instead of being built per thread; it grows to the peak concurrency
+_face_cascades = []
+_face_cascades_lock = threading.Lock()
+_frame_pool = None
+_frame_pool_lock = threading.Lock()
+
+def get_clahe():
+	if not hasattr(_thread_state, "clahe"):
+		_thread_state.clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
+	return _thread_state.clahe
+
+@contextmanager
+def face_cascade():
+	"""Borrows a Haar cascade no other thread is using for the duration
+	of the block"""
+	with _face_cascades_lock:
+		cascade = _face_cascades.pop() if _face_cascades else None
+	if cascade is None:
+		cascade = cv2.CascadeClassifier(HAAR_CASCADE_PATH)
+	try:
+		yield cascade
+	finally:
+		with _face_cascades_lock:
+			_face_cascades.append(cascade)
+
+def frame_pool():
+	"""Bounded thread pool for the per-frame stages. OpenCV releases
+	the GIL, so frames of one request are processed concurrently"""
+	global _frame_pool
+	if _frame_pool is None:
+		with _frame_pool_lock:
+			if _frame_pool is None:
+				_frame_pool = ThreadPoolExecutor(max_workers=FRAME_WORKERS, thread_name_prefix="frame")
+	return _frame_pool
+
+# output order of DeepFace's emotion model
+EMOTION_LABELS = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
+EMOTION_INPUT_SIZE = (48, 48)
 
 def preprocess_frame(frame):
-	lab = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-	l, a, b = cv2.split(lab)
-	clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
-	l = clahe.apply(l)
-	enhanced = cv2.merge([l, a, b])
-	return cv2.cvtColor(enhanced, cv2.COLOR_LAB2BGR)
+	with metrics.timed("clahe"):
+		lab = cv2.cvtColor(frame, cv2.COLOR_BGR2LAB)
+		l, a, b = cv2.split(lab)
+		l = get_clahe().apply(l)
+		enhanced = cv2.merge([l, a, b])
+		return cv2.cvtColor(enhanced, cv2.COLOR_LAB2BGR)
 
 def decode_base64_frame(b64_string):
-	img_data = base64.b64decode(b64_string)
-	np_arr = np.frombuffer(img_data, np.uint8)
-	frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-	return frame
-
-def facial_inference(image_array):
-	for i, b64_frame in enumerate(image_array):
-		frame = decode_base64_frame(b64_frame)
+	"""b64_string: base64 text (MFNP v1) or the raw JPEG bytes of an
+	MFNP v2 attachment, which are decoded without a copy"""
+	with metrics.timed("frame_decode"):
+		img_data = base64.b64decode(b64_string) if isinstance(b64_string, str) else b64_string
+		np_arr = np.frombuffer(img_data, np.uint8)
+		frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+		return frame
+
+def enhanced_gray(frame):
+	return cv2.cvtColor(preprocess_frame(frame), cv2.COLOR_BGR2GRAY)
+
+def largest_face(faces):
+	if len(faces) == 0:
+		return None
+	return tuple(int(v) for v in max(faces, key=lambda f: f[2] * f[3]))
+
+def extract_face_crop(frame):
+	"""Enhances a frame, runs Haar detection and returns the grayscale
+	crop of the largest face, or None when no face is found"""
+	enhanced_frame = preprocess_frame(frame)
+	with metrics.timed("haar_detect"):
+		gray = cv2.cvtColor(enhanced_frame, cv2.COLOR_BGR2GRAY)
+		with face_cascade() as cascade:
+			faces = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=7, minSize=(FACE_MIN_SIZE, FACE_MIN_SIZE))
+	box = largest_face(faces)
+	if box is None:
+		return None
+	x, y, w, h = box
+	return gray[y:y+h, x:x+w]
+
+def detect_face_downscaled(gray, scale=FACE_DETECT_SCALE):
+	"""Largest face box (x, y, w, h) in full-resolution coordinates, found
+	on a copy scaled by `scale`"""
+	with metrics.timed("haar_detect"):
+		small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+		min_size = max(1, int(FACE_MIN_SIZE * scale))
+		with face_cascade() as cascade:
+			box = largest_face(cascade.detectMultiScale(small, scaleFactor=1.1, minNeighbors=7, minSize=(min_size, min_size)))
+	if box is None:
+		return None
+	return tuple(int(round(v / scale)) for v in box)
+
+def search_face_near(gray, box, margin=FACE_SEARCH_MARGIN):
+	"""Face box close to `box`: the detector only scans a region `margin`
+	box sizes around it, for faces between 0.8 and 1.25 times its size"""
+	x, y, w, h = box
+	dx, dy = int(w * margin), int(h * margin)
+	x0, y0 = max(0, x - dx), max(0, y - dy)
+	x1, y1 = min(gray.shape[1], x + w + dx), min(gray.shape[0], y + h + dy)
+	with metrics.timed("face_track"), face_cascade() as cascade:
+		faces = cascade.detectMultiScale(
+			gray[y0:y1, x0:x1], scaleFactor=1.2, minNeighbors=7,
+			minSize=(max(FACE_MIN_SIZE, int(w * 0.8)), max(FACE_MIN_SIZE, int(h * 0.8))),
+			maxSize=(int(w * 1.25) + 1, int(h * 1.25) + 1))
+	found = largest_face(faces)
+	if found is None:
+		return None
+	fx, fy, fw, fh = found
+	return (fx + x0, fy + y0, fw, fh)
+
+
+class FaceTracker:
+	"""Detect-then-track face localisation over consecutive frames of one
+	client. A full detection runs on a downscaled copy of the first frame,
+	then every FACE_REDETECT_INTERVAL frames and whenever the face is lost;
+	the frames in between only search around the last box"""
+
+	def __init__(self, redetect_interval=FACE_REDETECT_INTERVAL):
+		self.redetect_interval = redetect_interval
+		self.box = None
+		self.tracked = 0  # frames followed since the last full detection
+
+	def locate(self, gray):
+		"""Face box (x, y, w, h) in this frame, or None"""
+		if self.box is not None and self.tracked < self.redetect_interval:
+			box = search_face_near(gray, self.box)
+			if box is not None:
+				self.box = box
+				self.tracked += 1
+				return box
+		self.box = detect_face_downscaled(gray)
+		self.tracked = 0
+		return self.box
+
+
+class FaceEmotionEngine:
+	"""Keeps DeepFace's emotion model in memory and scores many face
+	crops with a single batched forward pass"""
+
+	def __init__(self):
+		self._model = None
+		# Keras predict is not guaranteed to be thread-safe
+		self._lock = threading.Lock()
+
+	@property
+	def model(self):
+		if self._model is None:
+			with self._lock:
+				if self._model is None:
+					from deepface import DeepFace
+					try:
+						built = DeepFace.build_model(task="facial_attribute", model_name="Emotion")
+					except TypeError:
+						# deepface < 0.0.90 takes the model name only
+						built = DeepFace.build_model("Emotion")
+					self._model = getattr(built, "model", built)
+		return self._model
+
+	def predict(self, face_crops):
+		"""face_crops: list of grayscale face images
+		Returns: list of (emotion, confidence) in the same order"""
+		if not face_crops:
+			return []
+		with metrics.timed("deepface"):
+			return self._predict(face_crops)
+
+	def _predict(self, face_crops):
+		batch = np.stack([cv2.resize(crop, EMOTION_INPUT_SIZE) for crop in face_crops])
+		batch = batch.astype(np.float32)[..., np.newaxis] / 255.0
+		model = self.model
+		with self._lock:
+			probs = np.asarray(model.predict(batch, verbose=0))
+		probs = probs / (probs.sum(axis=1, keepdims=True) + 1e-9)
+		best = probs.argmax(axis=1)
+		return [(EMOTION_LABELS[k], float(probs[i, k])) for i, k in enumerate(best)]
+
+
+face_engine = FaceEmotionEngine()
+
+def decode_frames(image_array):
+	"""Decodes the frames concurrently. Returns [(index, frame), ...] in
+	request order for the frames that decode"""
+	frames = []
+	decoded = frame_pool().map(metrics.propagate(decode_base64_frame), image_array)
+	for i, frame in enumerate(decoded):
 		if frame is None:
 			print(f"Skipping frame {i+1}: cannot decode")
 			continue
+		frames.append((i, frame))
+	return frames
 
-		enhanced_frame = preprocess_frame(frame)
-		gray = cv2.cvtColor(enhanced_frame, cv2.COLOR_BGR2GRAY)
-		faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=7, minSize=(60, 60))
+def frame_hash(frame):
+	"""64-bit difference hash of a 9x8 grayscale thumbnail"""
+	gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+	thumb = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+	bits = thumb[:, 1:] > thumb[:, :-1]
+	return int.from_bytes(np.packbits(bits).tobytes(), "big")
 
-		for (x, y, w, h) in faces:
-			try:
-				result = DeepFace.analyze(
-					enhanced_frame, actions=['emotion'], enforce_detection=False,
-					detector_backend='opencv', silent=True
-				)
-				dominant = result[0]['dominant_emotion']
-				conf = result[0]['emotion'][dominant] / 100.0
+def select_distinct_frames(frames):
+	"""Drops near-duplicate frames from [(index, frame), ...].
+	Returns [[index, frame, weight], ...] where weight is the number of
+	input frames the kept frame stands for"""
+	selected = []
+	last_hash = None
+	for index, frame in frames:
+		h = frame_hash(frame)
+		if last_hash is not None and bin(h ^ last_hash).count("1") <= DUPLICATE_HASH_DISTANCE:
+			selected[-1][2] += 1
+			continue
+		selected.append([index, frame, 1])
+		last_hash = h
+	return selected
+
+def locate_faces(frames, tracker=None):
+	"""Grayscale face crop per frame, None where no face is found.
+	tracker: FaceTracker carried over from earlier frames of the same
+	client. In "track" mode CLAHE runs on the frame pool and the tracker
+	follows the face through the frames in order; in "detect" mode every
+	frame gets a full detection on the pool"""
+	if FACE_LOCALISATION != "track":
+		return list(frame_pool().map(metrics.propagate(extract_face_crop), frames))
+	if tracker is None:
+		tracker = FaceTracker()
+	crops = []
+	for gray in frame_pool().map(metrics.propagate(enhanced_gray), frames):
+		box = tracker.locate(gray)
+		if box is None:
+			crops.append(None)
+			continue
+		x, y, w, h = box
+		crops.append(gray[y:y+h, x:x+w])
+	return crops
+
+def score_frames(frames, tracker=None):
+	"""Finds the face in each decoded frame (see locate_faces) and scores
+	all crops in one batch. Returns per-frame (emotion, confidence), None
+	where no face was scored"""
+	if INFERENCE_BACKEND == "process":
+		import inference_pool
+		try:
+			return inference_pool.score_frames(frames, tracker or FaceTracker())
+		except Exception as e:
+			print(f"[Error]: inference worker: {e!r}")
+			return [None] * len(frames)
+	results = [None] * len(frames)
+	crops = []
+	crop_frames = []
+	for i, crop in enumerate(locate_faces(frames, tracker)):
+		if crop is not None:
+			crops.append(crop)
+			crop_frames.append(i)
 
-				if conf >= CONFIDENCE_THRESHOLD:
-					emotion_history_with_confidence.append((dominant, conf))
-				print(f"[Frame] → {dominant}")
+	try:
+		predictions = face_engine.predict(crops)
+	except Exception as e:
+		print(f"[Error]: {e}")
+		return results
 
-			except Exception as e:
-				print(f"[Error]: {e}")		
+	for i, prediction in zip(crop_frames, predictions):
+		results[i] = prediction
+	return results
 
-		time.sleep(0.2)			
+def is_emotion_decided(weighted_scores, remaining_weight):
+	"""True when the leading emotion cannot be overtaken, even if every
+	remaining frame went to the runner-up with full confidence"""
+	if not weighted_scores:
+		return False
+	ranked = sorted(weighted_scores.values(), reverse=True)
+	runner_up = ranked[1] if len(ranked) > 1 else 0.0
+	return ranked[0] - runner_up > remaining_weight
 
-def get_weighted_smoothed_emotion(frames_array, emotion_history_with_confidence):
+def get_weighted_smoothed_emotion(frames_array, emotion_history_with_confidence, session=None):
     """
     emotion_history_with_confidence: list of tuples [(emotion, confidence), ...]
+    session: optional EmotionSession of the client; its decayed earlier
+    results seed the tally and this request's results are added to it
     Returns: the weighted dominant emotion
+
+    Near-duplicate frames are scored once and counted with their weight.
+    Frames are scored a few at a time and scoring stops as soon as the
+    leading emotion can no longer be overtaken.
     """
-    facial_inference(frames_array)
+    selected = select_distinct_frames(decode_frames(frames_array))
+    remaining_weight = float(sum(weight for _, _, weight in selected))
+    weighted_scores = defaultdict(float)
+    tracker = FaceTracker()
+    if session is not None:
+        weighted_scores.update(session.prior(EMOTION_PRIOR_WEIGHT))
 
-    if not emotion_history_with_confidence:
+    for start in range(0, len(selected), SMOOTHING_CHUNK_SIZE):
+        chunk = selected[start:start + SMOOTHING_CHUNK_SIZE]
+        results = score_frames([frame for _, frame, _ in chunk], tracker)
+        for (i, _, weight), result in zip(chunk, results):
+            remaining_weight -= weight
+            if result is None:
+                continue
+            emotion, conf = result
+            print(f"[Frame {i+1}] → {emotion} (x{weight})")
+            if conf >= CONFIDENCE_THRESHOLD:
+                emotion_history_with_confidence.extend([(emotion, conf)] * weight)
+                weighted_scores[emotion] += conf * weight  # add confidence as weight
+                if session is not None:
+                    session.add(emotion, conf, weight)
+        if is_emotion_decided(weighted_scores, remaining_weight):
+            break
+
+    if not weighted_scores:
         return "neutral"
-    weighted_scores = defaultdict(float)
-    for emotion, conf in emotion_history_with_confidence:
-        weighted_scores[emotion] += conf  # add confidence as weight
     # picking the emotion with highest total confidence
     dominant = max(weighted_scores, key=weighted_scores.get)
     return dominant
+
+
+class EmotionSession:
+	"""Face results of one client across requests: a ring buffer of
+	(emotion, confidence, timestamp) and per-emotion scores that halve
+	every EMOTION_HALF_LIFE seconds. The scores are decayed and updated
+	incrementally, never recomputed from the buffer"""
+
+	def __init__(self, history_size=EMOTION_HISTORY_SIZE, half_life=EMOTION_HALF_LIFE):
+		self.entries = deque(maxlen=history_size)
+		self.half_life = half_life
+		self.scores = defaultdict(float)
+		self.last_activity = time.monotonic()
+		self._decayed_at = self.last_activity
+		self._lock = threading.Lock()
+
+	def _decay(self, now):
+		if now > self._decayed_at:
+			factor = 0.5 ** ((now - self._decayed_at) / self.half_life)
+			for emotion in self.scores:
+				self.scores[emotion] *= factor
+			self._decayed_at = now
+		self.last_activity = now
+
+	def add(self, emotion, confidence, weight=1):
+		"""Records a confident face result that stands for weight frames"""
+		now = time.monotonic()
+		with self._lock:
+			self._decay(now)
+			for _ in range(weight):
+				if len(self.entries) == self.entries.maxlen:
+					# the entry falling out of the buffer takes its decayed weight along
+					old_emotion, old_conf, old_time = self.entries[0]
+					old_weight = old_conf * 0.5 ** ((now - old_time) / self.half_life)
+					self.scores[old_emotion] = max(0.0, self.scores[old_emotion] - old_weight)
+				self.entries.append((emotion, confidence, now))
+				self.scores[emotion] += confidence
+
+	def prior(self, max_weight):
+		"""The decayed scores, scaled to add up to at most max_weight so a
+		long history cannot outvote a new request's frames"""
+		with self._lock:
+			self._decay(time.monotonic())
+			total = sum(self.scores.values())
+			if total <= 0:
+				return {}
+			scale = min(1.0, max_weight / total)
+			return {emotion: score * scale for emotion, score in self.scores.items() if score > 0}
+
+
+class EmotionSessionRegistry:
+	"""EmotionSessions by client session id, created on first use.
+	Sessions idle for longer than idle_timeout seconds are dropped, and
+	the least recently used one when max_sessions is reached"""
+
+	def __init__(self, idle_timeout=1800.0, max_sessions=1024):
+		self.idle_timeout = idle_timeout
+		self.max_sessions = max_sessions
+		self._sessions = {}
+		self._lock = threading.Lock()
+
+	def _evict_idle(self):
+		now = time.monotonic()
+		for session_id in [k for k, s in self._sessions.items() if now - s.last_activity > self.idle_timeout]:
+			del self._sessions[session_id]
+
+	def get(self, session_id):
+		with self._lock:
+			self._evict_idle()
+			session = self._sessions.get(session_id)
+			if session is None:
+				if len(self._sessions) >= self.max_sessions:
+					oldest = min(self._sessions, key=lambda k: self._sessions[k].last_activity)
+					del self._sessions[oldest]
+				session = self._sessions[session_id] = EmotionSession()
+			return session
+
+	def __len__(self):
+		with self._lock:
+			return len(self._sessions)
    
-def decode_base64_audio(b64_string, target_sr=16000):
-    try:
-        if ',' in b64_string:
-            b64_string = b64_string.split(',')[1]
-        audio_bytes = base64.b64decode(b64_string)
+# count and total seconds of audio decodes, per container format
+audio_decode_timings = defaultdict(lambda: [0, 0.0])
+_audio_timings_lock = threading.Lock()
+
+# sample dtype and scale to [-1, 1) for (WAVE format tag, bits per sample)
+_WAV_SAMPLE_TYPES = {
+    (1, 8): (np.uint8, 1 / 128.0, -1.0),
+    (1, 16): (np.dtype('<i2'), 1 / 32768.0, 0.0),
+    (1, 32): (np.dtype('<i4'), 1 / 2147483648.0, 0.0),
+    (3, 32): (np.dtype('<f4'), 1.0, 0.0),
+}
+
+def sniff_audio_format(data):
+    head = bytes(data[:12])
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav"
+    if head[:4] == b"fLaC":
+        return "flac"
+    if head[:4] == b"OggS":
+        return "ogg"
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        return "webm"
+    if head[4:8] == b"ftyp":
+        return "mp4"
+    return "unknown"
+
+def pcm_to_float32(raw, dtype, scale, offset, channels):
+    """Views raw PCM bytes as samples without copying, then converts to
+    mono float32 in one vectorised pass"""
+    usable = len(raw) - len(raw) % (np.dtype(dtype).itemsize * channels)
+    samples = np.frombuffer(raw[:usable], dtype=dtype)
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    audio_data = samples.astype(np.float32)
+    if scale != 1.0:
+        audio_data *= scale
+    if offset:
+        audio_data += offset
+    return audio_data
 
-        
-        audio_segment = AudioSegment.from_file(io.BytesIO(audio_bytes))
+def decode_wav_pcm(data):
+    """Parses a RIFF/WAVE buffer in-process. Returns (audio_data, sr) or
+    None when the encoding needs soundfile (e.g. 24-bit or compressed)"""
+    view = memoryview(data)
+    pos = 12
+    fmt = None
+    while pos + 8 <= len(view):
+        chunk_id = bytes(view[pos:pos + 4])
+        chunk_size = struct.unpack_from("<I", view, pos + 4)[0]
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            tag, channels, sr = struct.unpack_from("<HHI", view, body)
+            bits = struct.unpack_from("<H", view, body + 14)[0]
+            if tag == 0xFFFE and chunk_size >= 26:
+                # WAVE_FORMAT_EXTENSIBLE: the real tag opens the sub-format GUID
+                tag = struct.unpack_from("<H", view, body + 24)[0]
+            fmt = (tag, channels, sr, bits)
+        elif chunk_id == b"data" and fmt is not None:
+            tag, channels, sr, bits = fmt
+            sample_type = _WAV_SAMPLE_TYPES.get((tag, bits))
+            if sample_type is None or channels == 0:
+                return None
+            # browsers streaming WAV may leave the size at 0 or 0xFFFFFFFF
+            end = len(view) if chunk_size in (0, 0xFFFFFFFF) else min(len(view), body + chunk_size)
+            return pcm_to_float32(view[body:end], *sample_type, channels), sr
+        pos = body + chunk_size + (chunk_size & 1)
+    return None
 
-        
-        audio_segment = audio_segment.set_frame_rate(target_sr).set_channels(1)
+# anti-aliasing filter of resample_audio: passband edge relative to the
+# lower Nyquist frequency, and filter taps per polyphase branch
+RESAMPLE_CUTOFF = 0.95
+RESAMPLE_TAPS = 64
+_resample_filters = {}
 
-        
-        samples = np.array(audio_segment.get_array_of_samples())
+def resample_audio(audio_data, sr, target_sr):
+    """Polyphase resampler behind a Kaiser-windowed low-pass FIR, so
+    content above the new Nyquist frequency does not fold back into the
+    band the voice features (ZCR, spectral centroid) are computed from.
+    Filters are cached per rate pair"""
+    if sr == target_sr or len(audio_data) == 0:
+        return audio_data
+    from math import gcd
+    from scipy.signal import firwin, resample_poly
+    g = gcd(int(sr), int(target_sr))
+    up, down = int(target_sr) // g, int(sr) // g
+    h = _resample_filters.get((up, down))
+    if h is None:
+        max_rate = max(up, down)
+        h = firwin(RESAMPLE_TAPS * max_rate + 1, RESAMPLE_CUTOFF / max_rate, window=('kaiser', 8.0))
+        _resample_filters[(up, down)] = h
+    return resample_poly(audio_data, up, down, window=h).astype(np.float32)
 
-        
-        if audio_segment.sample_width == 2:
-            audio_data = samples.astype(np.float32) / 32768.0
-        elif audio_segment.sample_width == 4: 
-            audio_data = samples.astype(np.float32) / 2147483648.0
+def _decode_with_ffmpeg(audio_bytes, target_sr):
+    from pydub import AudioSegment
+    audio_segment = AudioSegment.from_file(io.BytesIO(audio_bytes))
+    audio_segment = audio_segment.set_frame_rate(target_sr).set_channels(1)
+    dtype = {1: np.int8, 2: np.dtype('<i2'), 4: np.dtype('<i4')}[audio_segment.sample_width]
+    scale = 1.0 / (1 << (8 * audio_segment.sample_width - 1))
+    return pcm_to_float32(audio_segment.raw_data, dtype, scale, 0.0, 1), target_sr
+
+def _decode_with_soundfile(audio_bytes):
+    import soundfile as sf
+    audio_data, sr = sf.read(io.BytesIO(audio_bytes), dtype='float32', always_2d=True)
+    return audio_data.mean(axis=1) if audio_data.shape[1] > 1 else audio_data[:, 0], sr
+
+def audio_decode_report():
+    """{format: {"count": n, "avg_ms": ms}} of the decodes so far"""
+    with _audio_timings_lock:
+        return {fmt: {"count": n, "avg_ms": round(1000 * total / n, 3)}
+                for fmt, (n, total) in audio_decode_timings.items() if n}
+
+def decode_base64_audio(b64_string, target_sr=16000):
+    """Decodes a base64 (optionally data-URL) audio clip to mono float32 at
+    target_sr. WAV and FLAC are decoded in-process; headerless
+    "data:audio/pcm;rate=N" clips are read as 16-bit mono; only formats
+    such as webm/opus from browsers go through pydub/ffmpeg.
+    Raw bytes (an MFNP v2 attachment) are used as they are"""
+    start = time.perf_counter()
+    fmt = "unknown"
+    try:
+        mime = ""
+        if not isinstance(b64_string, str):
+            audio_bytes = b64_string
+        else:
+            if ',' in b64_string:
+                mime, b64_string = b64_string.split(',', 1)
+            audio_bytes = base64.b64decode(b64_string)
+
+        if mime.startswith("data:audio/pcm") or mime.startswith("data:audio/l16"):
+            fmt = "pcm"
+            rate = re.search(r"rate=(\d+)", mime)
+            sr = int(rate.group(1)) if rate else target_sr
+            audio_data = pcm_to_float32(memoryview(audio_bytes), np.dtype('<i2'), 1 / 32768.0, 0.0, 1)
         else:
-            audio_data = samples.astype(np.float32)
+            fmt = sniff_audio_format(audio_bytes)
+            decoded = decode_wav_pcm(audio_bytes) if fmt == "wav" else None
+            if decoded is None and fmt in ("wav", "flac"):
+                decoded = _decode_with_soundfile(audio_bytes)
+            if decoded is None:
+                decoded = _decode_with_ffmpeg(audio_bytes, target_sr)
+            audio_data, sr = decoded
 
+        audio_data = resample_audio(audio_data, sr, target_sr)
         return audio_data, target_sr
     
     except Exception as e:
         print(f"❌ Audio Decoding Error: {e}")
        
         return None, target_sr
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.record("audio_decode", elapsed)
+        with _audio_timings_lock:
+            timing = audio_decode_timings[fmt]
+            timing[0] += 1
+            timing[1] += elapsed
+
+# framing shared by every voice feature (librosa's defaults)
+VOICE_FRAME_LENGTH = 2048
+VOICE_HOP_LENGTH = 512
+# the "pitch" the voice rules threshold on is librosa.piptrack's statistic:
+# the mean frequency of every spectral peak between VOICE_PITCH_FMIN and
+# VOICE_PITCH_FMAX above VOICE_PEAK_THRESHOLD of its frame's loudest bin
+# (piptrack's defaults). It is not an f0: for speech it sits in the
+# kHz range, and the 120/100 Hz rule thresholds were set against it
+VOICE_PITCH_FMIN = 150.0
+VOICE_PITCH_FMAX = 4000.0
+VOICE_PEAK_THRESHOLD = 0.1
+_hann_cache = {}
+
+def _voice_window(n):
+    """Periodic Hann window, cached per length"""
+    if n not in _hann_cache:
+        _hann_cache[n] = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n) / n)).astype(np.float32)
+    return _hann_cache[n]
+
+def spectral_peak_pitch(magnitude, sr, n):
+    """librosa.piptrack(...) followed by mean(pitches[pitches > 0]), on an
+    already computed (frames, bins) magnitude spectrum. 0 without peaks"""
+    if magnitude.shape[0] == 0 or magnitude.shape[1] < 3:
+        return 0
+    thresholded = magnitude * (magnitude > VOICE_PEAK_THRESHOLD * magnitude.max(axis=1, keepdims=True))
+    centre = thresholded[:, 1:-1]
+    peaks = np.zeros(magnitude.shape, dtype=bool)
+    peaks[:, 1:-1] = (centre > thresholded[:, :-2]) & (centre >= thresholded[:, 2:])
+    peaks[:, -1] = thresholded[:, -1] > thresholded[:, -2]
+    freqs = np.fft.rfftfreq(n, 1.0 / sr)
+    peaks &= (VOICE_PITCH_FMIN <= freqs) & (freqs < min(VOICE_PITCH_FMAX, sr / 2))
+
+    # parabolic interpolation around each peak bin, none at the edges
+    a = magnitude[:, 2:] + magnitude[:, :-2] - 2 * magnitude[:, 1:-1]
+    b = (magnitude[:, 2:] - magnitude[:, :-2]) / 2
+    shift = np.zeros(magnitude.shape)
+    shift[:, 1:-1] = np.divide(-b, a, out=np.zeros(a.shape), where=np.abs(b) < np.abs(a))
+    rows, bins = np.nonzero(peaks)
+    pitches = (bins + shift[rows, bins]) * float(sr) / n
+    # piptrack leaves 0 where a peak lands on 0 Hz; those are not counted
+    pitches = pitches[pitches > 0]
+    return float(np.mean(pitches)) if len(pitches) else 0
 
 def extract_audio_features(audio_data, sr=16000):
+    """RMS, pitch, zero-crossing rate and spectral centroid from one
+    framing and one STFT, matching extract_audio_features_librosa. Pitch
+    is piptrack's mean spectral peak frequency (see spectral_peak_pitch)"""
+    audio_data = np.asarray(audio_data, dtype=np.float32)
+    audio_data = audio_data / (np.max(np.abs(audio_data)) + 1e-6) # normalize
+
+    n = VOICE_FRAME_LENGTH
+    padded = np.pad(audio_data, n // 2)
+    # (n_frames, n) strided view, no copy
+    frames = np.lib.stride_tricks.sliding_window_view(padded, n)[::VOICE_HOP_LENGTH]
+
+    # RMS energy
+    rms = float(np.mean(np.sqrt(np.mean(frames ** 2, axis=1))))
+
+    # Zero crossing rate (samples within +-1e-10 count as positive, like librosa)
+    positive = frames >= -1e-10
+    zcr = float(np.mean(np.count_nonzero(positive[:, 1:] != positive[:, :-1], axis=1) / n))
+
+    # the one STFT
+    from scipy import fft as sp_fft
+    window = _voice_window(n)
+    spectrum = sp_fft.rfft(frames * window, axis=1, workers=-1)
+    magnitude = np.abs(spectrum)
+
+    # Spectral centroid
+    freqs = np.fft.rfftfreq(n, 1.0 / sr)
+    total = magnitude.sum(axis=1)
+    centroid = np.divide(magnitude @ freqs, total, out=np.zeros_like(total), where=total > 0)
+    spec_centroid = float(np.mean(centroid))
+
+    # Pitch, from the same magnitude spectrum
+    pitch = spectral_peak_pitch(magnitude, sr, n)
+
+    return rms, pitch, zcr, spec_centroid
+
+def extract_audio_features_librosa(audio_data, sr=16000):
+    """Reference implementation with four separate librosa passes, kept
+    for the parity check in bench/voice_features.py"""
+    import librosa
     audio_data = audio_data.astype(np.float32)
     audio_data = audio_data / (np.max(np.abs(audio_data)) + 1e-6) # normalize
     
@@ -135,30 +725,76 @@ def extract_audio_features(audio_data, sr=16000):
     return rms, pitch, zcr, spec_centroid
 
 
-def estimate_voice_emotion(audio_data, sr=16000):
-    rms, pitch, zcr, spec_centroid = extract_audio_features(audio_data, sr)
+def voice_tone_from_features(rms, pitch, zcr, spec_centroid):
     # Rules (tuned for Jetson mic)
     if rms > 0.02 and pitch > 120 and zcr > 0.02:
-        voice_tone = "happy"
+        return "happy"
     elif rms < 0.01 and pitch < 100 and zcr < 0.01:
-        voice_tone = "sad"
+        return "sad"
+    return "neutral"
+
+
+def estimate_voice_emotion(audio_data, sr=16000):
+    if audio_data is None or len(audio_data) == 0:
+        return "neutral"
+    if INFERENCE_BACKEND == "process":
+        import inference_pool
+        try:
+            return inference_pool.voice_tone(audio_data, sr)
+        except Exception as e:
+            print(f"[Error]: inference worker: {e!r}")
+            return "neutral"
+    with metrics.timed("voice_features"):
+        features = extract_audio_features(audio_data, sr)
+    return voice_tone_from_features(*features)
+
+
+def warm_up():
+    """Loads the emotion model and runs one dummy inference through the
+    frame, face and voice stages, so the first real request does not pay
+    for the lazy imports or the model's first forward pass.
+    Returns {phase: seconds}"""
+    phases = {}
+    start = time.perf_counter()
+    if INFERENCE_BACKEND == "process":
+        # the workers load the model; this process never does
+        import inference_pool
+        inference_pool.warm_up()
+        phases["inference_workers"] = time.perf_counter() - start
     else:
-        voice_tone = "neutral"
+        face_engine.model
+        phases["emotion_model"] = time.perf_counter() - start
 
-    return voice_tone
+    start = time.perf_counter()
+    blank = np.full((240, 320, 3), 128, np.uint8)
+    ok, jpg = cv2.imencode('.jpg', blank)
+    score_frames([frame for _, frame in decode_frames([base64.b64encode(jpg.tobytes()).decode()])])
+    if INFERENCE_BACKEND != "process":
+        face_engine.predict([np.full(EMOTION_INPUT_SIZE, 128, np.uint8)])
+    estimate_voice_emotion(np.zeros(16000, np.float32))
+    phases["warm_inference"] = time.perf_counter() - start
+    return phases
 
 
-def ask_ollama(prompt_text):
-    """Call Ollama CLI to get movie recommendations"""
-    try:
-        result = subprocess.run(
-            ["ollama", "run", OLLAMA_MODEL, prompt_text],
-            capture_output=True, text=True, check=True
-        )
-        return result.stdout.strip()
-    except subprocess.CalledProcessError as e:
-        print("Error calling Ollama:", e)
-        return ""
+ollama_client = OllamaClient(OLLAMA_URL, OLLAMA_MODEL, keep_alive=OLLAMA_KEEP_ALIVE, timeout=OLLAMA_TIMEOUT)
+
+llm_cache = RecommendationCache(max_size=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL)
+
+def parse_movie_titles(text):
+    return MOVIE_TITLE_PATTERN.findall(text)
+
+def has_enough_titles(text):
+    return len(parse_movie_titles(text)) >= NUM_RECOMMENDATIONS
+
+def ask_ollama_reply(prompt_text, deadline=None):
+    """Ask the local Ollama server for movie recommendations. The reply is
+    streamed and reading stops once NUM_RECOMMENDATIONS titles are in or
+    the deadline (a time.monotonic() value) passes.
+    Returns: LLMReply(text, complete)"""
+    return ollama_client.generate(prompt_text, stop_when=has_enough_titles, deadline=deadline)
+
+def ask_ollama(prompt_text, deadline=None):
+    return ask_ollama_reply(prompt_text, deadline).text.strip()
 
 def fit_with_other(le, series):
 	values = series.tolist()
@@ -166,20 +802,84 @@ def fit_with_other(le, series):
 	le.fit(values)
 	return le
 
-def safe_transform(le, value):
-	if value not in le.classes_:
-		return le.transform(["other"])[0]
-	return le.transform([value])[0]
+def read_user_data(csv_file):
+	"""csv_file: path or file-like object. None when the path is missing"""
+	if isinstance(csv_file, str) and not os.path.exists(csv_file):
+		return None
+	import pandas as pd
+	return pd.read_csv(csv_file)
+
+# RandomForest input columns, in order
+FEATURE_COLUMNS = ('latitude', 'longitude', 'temperature', 'city', 'today_status',
+	'tomorrow_status', 'weather_desc', 'mood', 'tone')
+
+class FeatureEncoder:
+	"""The LabelEncoders of one trained model compiled to dicts, so a
+	request context is encoded with a few lookups straight into a NumPy
+	feature row, without pandas or a LabelEncoder call per column"""
+
+	def __init__(self, encoders):
+		le_city, le_today, le_tomorrow, le_weather, le_mood, le_tone, le_movie = encoders
+		# environment key and value -> code; unseen values map to "other"
+		self.environment = [
+			(key, self._codes(le), self._codes(le)["other"])
+			for key, le in (('city', le_city), ('today_status', le_today),
+				('tomorrow_status', le_tomorrow), ('weather_desc', le_weather))
+		]
+		self.mood = self._codes(le_mood)
+		self.tone = self._codes(le_tone)
+		self.movies = np.asarray(le_movie.classes_, dtype=object)
+
+	@staticmethod
+	def _codes(le):
+		return {value: code for code, value in enumerate(le.classes_.tolist())}
+
+	def encode(self, contexts, analyses):
+		"""Feature matrix with one row per (context, analysis)"""
+		features = np.empty((len(contexts), len(FEATURE_COLUMNS)), dtype=np.float64)
+		for row, context, analysis in zip(features, contexts, analyses):
+			env = context['environment']
+			row[0] = float(env['lat'])
+			row[1] = float(env['lon'])
+			row[2] = float(env['temperature'])
+			for i, (key, codes, other) in enumerate(self.environment, 3):
+				row[i] = codes.get(env[key], other)
+			row[7] = self.mood[analysis.mood]
+			row[8] = self.tone[analysis.tone]
+		return features
 
-def train_on_user_data(csv_file):
+	def movie_titles(self, indices):
+		return self.movies[indices].tolist()
+
+# (encoders, FeatureEncoder) of the last model that ranked a request;
+# replaced as a whole when a new model is swapped in
+_compiled_encoder = (None, None)
+
+def compiled_encoder(encoders):
+	global _compiled_encoder
+	compiled_for, encoder = _compiled_encoder
+	if compiled_for is not encoders:
+		encoder = FeatureEncoder(encoders)
+		_compiled_encoder = (encoders, encoder)
+	return encoder
+
+def same_classes(encoders, other_encoders):
+	return all(np.array_equal(a.classes_, b.classes_) for a, b in zip(encoders, other_encoders))
+
+def train_on_user_data(csv_file, previous=None):
 	"""This function implements the standard 
 	recommendation system used by companies, 
-	based on user's clicks"""
-	if not os.path.exists(csv_file):
-		return None, None
-	
-	df = pd.read_csv(csv_file)
-	if df.empty:
+	based on user's clicks
+
+	csv_file: path to the log, or an already loaded DataFrame
+	previous: optional (clf, encoders) from an earlier run. When the
+	encoders come out identical, a copy of that forest is warm-started
+	with RF_WARM_START_TREES new trees instead of refitting every tree"""
+	import pandas as pd
+	from sklearn.preprocessing import LabelEncoder
+	from sklearn.ensemble import RandomForestClassifier
+	df = csv_file if isinstance(csv_file, pd.DataFrame) else read_user_data(csv_file)
+	if df is None or df.empty:
 		return None, None
 	
 	possible_emotions = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
@@ -204,24 +904,204 @@ def train_on_user_data(csv_file):
 	le_mood.fit(possible_emotions)
 	le_tone.fit(possible_tones)
 
-	features = df[['latitude', 'longitude', 'temperature']].copy()
-	features['city'] = le_city.transform(df['city'])
-	features['today_status'] = le_today.transform(df['today_status'])
-	features['tomorrow_status'] = le_tomorrow.transform(df['tomorrow_status'])
-	#features['weekday'] = le_weekday.transform(df['weekday'])
-	features['weather_desc'] = le_weather.transform(df['weather_desc'])
-	features['mood'] = le_mood.transform(df['mood'])
-	features['tone'] = le_tone.transform(df['voice_tone'])
-	
+	# a plain matrix in FEATURE_COLUMNS order, the layout FeatureEncoder
+	# writes at request time
+	features = np.empty((len(df), len(FEATURE_COLUMNS)), dtype=np.float64)
+	features[:, 0] = df['latitude'].to_numpy(dtype=np.float64)
+	features[:, 1] = df['longitude'].to_numpy(dtype=np.float64)
+	features[:, 2] = df['temperature'].to_numpy(dtype=np.float64)
+	features[:, 3] = le_city.transform(df['city'])
+	features[:, 4] = le_today.transform(df['today_status'])
+	features[:, 5] = le_tomorrow.transform(df['tomorrow_status'])
+	#le_weekday.transform(df['weekday'])
+	features[:, 6] = le_weather.transform(df['weather_desc'])
+	features[:, 7] = le_mood.transform(df['mood'])
+	features[:, 8] = le_tone.transform(df['voice_tone'])
 
 	target = le_movie.fit_transform(df['movie_selected'])
+	encoders = (le_city, le_today, le_tomorrow, le_weather, le_mood, le_tone, le_movie)
 
-	clf = RandomForestClassifier(n_estimators=50)
+	prev_clf, prev_encoders = previous if previous is not None else (None, None)
+	if (prev_clf is not None and prev_clf.n_estimators + RF_WARM_START_TREES <= RF_MAX_TREES
+			and same_classes(encoders, prev_encoders)):
+		# the live model keeps serving while the copy grows
+		clf = copy.deepcopy(prev_clf)
+		clf.set_params(warm_start=True, n_estimators=prev_clf.n_estimators + RF_WARM_START_TREES)
+	else:
+		clf = RandomForestClassifier(n_estimators=RF_TREES)
 	clf.fit(features, target)
-	return clf, (le_city, le_today, le_tomorrow, le_weather, le_mood, le_tone, le_movie)
+	return clf, encoders
 
 
-def ollama_inference(payload):
+class RequestAnalysis:
+	"""Per-request view of an /inference payload. Frames and audio are
+	decoded and analysed at most once, so the LLM prompt and the
+	classifier see the same mood and voice tone."""
+
+	def __init__(self, payload, mood=None, tone=None, session=None):
+		"""mood, tone: already known values (e.g. from a stream), which
+		skip the corresponding analysis
+		session: EmotionSession of the client, see get_weighted_smoothed_emotion"""
+		self.payload = payload
+		self.session = session
+		self.emotion_history_with_confidence = []
+		# False when the LLM reply was cut short by the deadline
+		self.llm_complete = True
+		self._mood = mood
+		self._tone = tone
+		# the LLM and classifier branches may ask from different threads;
+		# one lock per attribute, so face and voice analysis can overlap
+		self._mood_lock = threading.Lock()
+		self._tone_lock = threading.Lock()
+
+	@property
+	def mood(self):
+		with self._mood_lock:
+			if self._mood is None:
+				self._mood = str(get_weighted_smoothed_emotion(self.payload.get('images', []), self.emotion_history_with_confidence, self.session))
+			return self._mood
+
+	@property
+	def tone(self):
+		with self._tone_lock:
+			if self._tone is None:
+				audio_data, sr = decode_base64_audio(self.payload.get('audio', ''))
+				self._tone = estimate_voice_emotion(audio_data, sr)
+			return self._tone
+
+
+class InferenceStream:
+	"""Incremental analysis for frames and audio pushed while the client is
+	still capturing. Each pushed frame is deduplicated against the last
+	kept one and scored right away, so the mood tally is current when the
+	client says it is done"""
+
+	def __init__(self):
+		self.emotion_history_with_confidence = []
+		self.weighted_scores = defaultdict(float)
+		self.frames_seen = 0
+		self.last_activity = time.monotonic()
+		self._last_hash = None
+		self._last_result = None
+		self._tracker = FaceTracker()
+		self._audio = bytearray()
+		self._lock = threading.Lock()
+
+	def _count(self, result, weight=1):
+		if result is None:
+			return
+		emotion, conf = result
+		if conf >= CONFIDENCE_THRESHOLD:
+			self.emotion_history_with_confidence.extend([(emotion, conf)] * weight)
+			self.weighted_scores[emotion] += conf * weight
+
+	def add_frames(self, image_array):
+		with self._lock:
+			self.last_activity = time.monotonic()
+			fresh = []
+			for _, frame in decode_frames(image_array):
+				self.frames_seen += 1
+				h = frame_hash(frame)
+				if self._last_hash is not None and bin(h ^ self._last_hash).count("1") <= DUPLICATE_HASH_DISTANCE:
+					if fresh:
+						fresh[-1][1] += 1
+					else:
+						# duplicate of a frame scored in an earlier push
+						self._count(self._last_result)
+					continue
+				self._last_hash = h
+				fresh.append([frame, 1])
+
+			results = score_frames([frame for frame, _ in fresh], self._tracker)
+			for (_, weight), result in zip(fresh, results):
+				self._count(result, weight)
+			if results:
+				self._last_result = results[-1]
+
+	def add_audio(self, chunk):
+		"""chunk: base64 text or raw bytes; chunks are concatenated in order.
+		Raises ValueError for invalid base64, or when the stream's audio
+		would exceed STREAM_AUDIO_MAX_BYTES (the chunk is then dropped)"""
+		if isinstance(chunk, str):
+			if ',' in chunk:
+				chunk = chunk.split(',', 1)[1]
+			try:
+				chunk = base64.b64decode(chunk, validate=True)
+			except binascii.Error as e:
+				raise ValueError(f"Invalid base64 audio: {e}")
+		with self._lock:
+			self.last_activity = time.monotonic()
+			if len(self._audio) + len(chunk) > STREAM_AUDIO_MAX_BYTES:
+				raise ValueError(f"Stream audio exceeds {STREAM_AUDIO_MAX_BYTES} bytes")
+			self._audio += chunk
+
+	@property
+	def audio_bytes(self):
+		return len(self._audio)
+
+	@property
+	def mood(self):
+		with self._lock:
+			if not self.weighted_scores:
+				return "neutral"
+			return max(self.weighted_scores, key=self.weighted_scores.get)
+
+	def analysis(self, payload):
+		"""RequestAnalysis for the closing message, using the tallied mood
+		and the voice tone of the concatenated audio"""
+		with self._lock:
+			audio = bytes(self._audio)
+		tone = "neutral"
+		if audio:
+			audio_data, sr = decode_base64_audio(audio)
+			tone = estimate_voice_emotion(audio_data, sr)
+		analysis = RequestAnalysis(payload, mood=self.mood, tone=tone)
+		analysis.emotion_history_with_confidence = list(self.emotion_history_with_confidence)
+		return analysis
+
+
+class InferenceStreamRegistry:
+	"""Open InferenceStreams by id; streams idle for longer than
+	idle_timeout seconds are dropped"""
+
+	def __init__(self, idle_timeout=120.0):
+		self.idle_timeout = idle_timeout
+		self._streams = {}
+		self._lock = threading.Lock()
+
+	def _evict_idle(self):
+		now = time.monotonic()
+		for stream_id in [k for k, s in self._streams.items() if now - s.last_activity > self.idle_timeout]:
+			del self._streams[stream_id]
+
+	def open(self):
+		with self._lock:
+			self._evict_idle()
+			stream_id = uuid.uuid4().hex
+			self._streams[stream_id] = InferenceStream()
+			return stream_id
+
+	def get(self, stream_id):
+		with self._lock:
+			self._evict_idle()
+			return self._streams.get(stream_id)
+
+	def close(self, stream_id):
+		with self._lock:
+			return self._streams.pop(stream_id, None)
+
+	def __len__(self):
+		with self._lock:
+			return len(self._streams)
+
+
+def ollama_inference(payload, analysis=None, deadline=None):
+	"""Returns (movie_titles, mood, voice_tone). When deadline (a
+	time.monotonic() value) passes mid-generation, the titles parsed so
+	far are returned and analysis.llm_complete is set to False"""
+	if analysis is None:
+		analysis = RequestAnalysis(payload)
+
 	city = payload["environment"]["city"]
 	lat = float(payload["environment"]["lat"])
 	lon = float(payload["environment"]["lon"])
@@ -231,9 +1111,13 @@ def ollama_inference(payload):
 	weather_desc = payload["environment"]["weather_desc"]
 	temperature = payload["environment"]["temperature"]
 	#mood = payload["mood"]
-	mood = str(get_weighted_smoothed_emotion(payload['images'], emotion_history_with_confidence))
-	audio_data, sr = decode_base64_audio(payload['audio'])
-	voice_tone = estimate_voice_emotion(audio_data, sr)
+	mood = analysis.mood
+	voice_tone = analysis.tone
+
+	cache_key = context_key(payload["environment"], mood, voice_tone)
+	movie_titles = llm_cache.get(cache_key)
+	if movie_titles is not None:
+		return list(movie_titles), mood, voice_tone
 	
 	prompt = f"""
 	You are a movie recommendation assistant. The user context is:
@@ -246,44 +1130,55 @@ def ollama_inference(payload):
 	Recommend 5 movie names that the user is most likely to enjoy right now. 
 	"""
 	
-	response = ask_ollama(prompt)
-	movie_titles = re.findall(r"\d+\.\s*(.*?)\s*\(\d{4}\)", response)
+	with metrics.timed("llm"):
+		reply = ask_ollama_reply(prompt, deadline)
+	analysis.llm_complete = reply.complete
+	movie_titles = parse_movie_titles(reply.text)
+	if movie_titles and reply.complete:
+		llm_cache.put(cache_key, movie_titles)
 	return movie_titles, mood, voice_tone	
 
-def combined_recommendations(primary_movies, clf_tuple, user_context):
+def classifier_ranking(clf_tuple, user_context, analysis=None):
+	"""Movies ranked by the RandomForest for this context, best first.
+	Empty when no model has been trained yet"""
+	if clf_tuple[0] is None:
+		return []
+	if analysis is None:
+		analysis = RequestAnalysis(user_context)
+	return classifier_rankings(clf_tuple, [user_context], [analysis])[0]
+
+def forest_proba(clf, features):
+	"""clf.predict_proba(features) without the joblib dispatch, which
+	costs milliseconds for a single row. Trees are summed in the same
+	order as sklearn does, so the result is identical"""
+	features = np.ascontiguousarray(features, dtype=np.float32)
+	probs = np.zeros((len(features), clf.n_classes_), dtype=np.float64)
+	for estimator in clf.estimators_:
+		probs += estimator.predict_proba(features, check_input=False)
+	probs /= len(clf.estimators_)
+	return probs
+
+def classifier_rankings(clf_tuple, user_contexts, analyses):
+	"""classifier_ranking for several contexts with one predict_proba call.
+	Returns one ranking per context"""
 	clf, encoders = clf_tuple
 	if clf is None:
-		return primary_movies
+		return [[] for _ in user_contexts]
+	encoder = compiled_encoder(encoders)
+	features = encoder.encode(user_contexts, analyses)
+	with metrics.timed("rf_predict"):
+		pred_probs = forest_proba(clf, features)
+	top_indices = pred_probs.argsort(axis=1)[:, ::-1]
+	return [encoder.movie_titles(row) for row in top_indices]
 
-	le_city, le_today, le_tomorrow, le_weather, le_mood, le_tone, le_movie = encoders
-
-	audio_data, sr = decode_base64_audio(user_context['audio'])
-
-	df = pd.DataFrame([{
-		'latitude': user_context['environment']['lat'],
-		'longitude': user_context['environment']['lon'],
-                'temperature': user_context['environment']['temperature'],
-		'city':safe_transform(le_city, user_context['environment']['city']),
-		'today_status':safe_transform(le_today, user_context['environment']['today_status']),
-		'tomorrow_status':safe_transform(le_tomorrow, user_context['environment']['tomorrow_status']),
-		#'weekday':le_weekday.transform([user_context['weekday']])[0],
-		'weather_desc':safe_transform(le_weather, user_context['environment']['weather_desc']),
-		'mood':le_mood.transform([get_weighted_smoothed_emotion(user_context['images'], emotion_history_with_confidence)])[0],
-		'tone': le_tone.transform([estimate_voice_emotion(audio_data, sr)])[0]
-	}])
-	pred_probs = clf.predict_proba(df)[0]
-	top_indices = pred_probs.argsort()[::-1]
-	top_movies = le_movie.inverse_transform(top_indices)
-
-	final_list = []
-	for movie in top_movies:
-		if movie not in final_list:
-			final_list.append(movie)
-	for movie in primary_movies:
-		if movie not in final_list:
-			final_list.append(movie)
-	
-	return final_list
+def merge_recommendations(ranked_movies, primary_movies):
+	"""Ranked movies then the primary ones, first occurrence kept"""
+	return list(dict.fromkeys(itertools.chain(ranked_movies, primary_movies)))
+
+def combined_recommendations(primary_movies, clf_tuple, user_context, analysis=None):
+	if clf_tuple[0] is None:
+		return primary_movies
+	return merge_recommendations(classifier_ranking(clf_tuple, user_context, analysis), primary_movies)
 
 
 		
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Compares two bench/e2e.py result files.
+
+    python3 bench/compare.py baseline.json run.json [--threshold 0.10]
+
+Prints p50/p95 per endpoint and per stage with the relative change, and
+exits with status 1 when any p95 got slower by more than the threshold
+(and by at least --min-ms, so sub-millisecond stages do not flap).
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def change(old, new):
+    if not old or new is None:
+        return None
+    return (new - old) / old
+
+
+def fmt(value):
+    return "-" if value is None else f"{value:+.1%}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compare two e2e benchmark runs")
+    parser.add_argument("baseline")
+    parser.add_argument("run")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative p95 slowdown")
+    parser.add_argument("--min-ms", type=float, default=1.0, help="ignore p95 slowdowns smaller than this")
+    args = parser.parse_args()
+
+    baseline, run = load(args.baseline), load(args.run)
+    rows = []
+    old_results = {(r["endpoint"], r.get("log_rows"), r["concurrency"]): r for r in baseline["results"]}
+    for r in run["results"]:
+        key = (r["endpoint"], r.get("log_rows"), r["concurrency"])
+        if key in old_results:
+            rows.append((f"{r['endpoint']} [{r.get('log_rows')}]", old_results[key], r))
+    for stage, s in run.get("stages", {}).items():
+        if stage in baseline.get("stages", {}):
+            rows.append((f"stage {stage}", baseline["stages"][stage], s))
+
+    regressions = []
+    print(f"{'':<40} {'p50 old':>9} {'p50 new':>9} {'change':>8} {'p95 old':>9} {'p95 new':>9} {'change':>8}")
+    for name, old, new in rows:
+        p50 = change(old.get("p50_ms"), new.get("p50_ms"))
+        p95 = change(old.get("p95_ms"), new.get("p95_ms"))
+        print(f"{name:<40} {old.get('p50_ms', '-'):>9} {new.get('p50_ms', '-'):>9} {fmt(p50):>8} "
+              f"{old.get('p95_ms', '-'):>9} {new.get('p95_ms', '-'):>9} {fmt(p95):>8}")
+        if p95 is not None and p95 > args.threshold and new["p95_ms"] - old["p95_ms"] >= args.min_ms:
+            regressions.append(f"{name}: p95 {old['p95_ms']} -> {new['p95_ms']} ms ({fmt(p95)})")
+
+    if regressions:
+        print(f"\np95 regressions above {args.threshold:.0%}:")
+        for regression in regressions:
+            print(" -", regression)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""End-to-end load benchmark for server.py.
+
+Runs the real JetsonHandler on a free local port against a synthetic
+user log, with the LLM served by ollama_stub and the emotion model
+replaced by a fixed-latency stub, so no camera, microphone, GPU or
+Ollama is needed. Every endpoint is driven by `--concurrency` client
+threads; /inference asks for the per-request stage timings, so stage
+percentiles come from the same requests.
+
+    python3 bench/e2e.py --log-rows 1000 100000 1000000 --concurrency 4 --output run.json
+    python3 bench/compare.py baseline.json run.json
+
+Log endpoints are measured once per log size; /inference runs first,
+with the model trained on a separate --train-rows log.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import synthetic
+import logstore
+import metrics
+import ollama_stub
+
+
+class StubEmotionEngine:
+    """Stands in for aiengine.FaceEmotionEngine: one model call costs
+    `batch_ms`, and the label depends only on the crop"""
+
+    def __init__(self, labels, batch_ms=20.0):
+        self.labels = labels
+        self.batch_ms = batch_ms
+
+    def predict(self, face_crops):
+        if not face_crops:
+            return []
+        with metrics.timed("deepface"):
+            time.sleep(self.batch_ms / 1000)
+            return [(self.labels[int(crop.mean()) % len(self.labels)], 0.9) for crop in face_crops]
+
+
+def percentiles(samples):
+    if not samples:
+        return {"count": 0}
+    a = np.asarray(samples) * 1e3
+    return {
+        "count": len(a),
+        "mean_ms": round(float(a.mean()), 3),
+        "p50_ms": round(float(np.percentile(a, 50)), 3),
+        "p95_ms": round(float(np.percentile(a, 95)), 3),
+        "p99_ms": round(float(np.percentile(a, 99)), 3),
+    }
+
+
+def mfnp(message_type, payload):
+    return json.dumps({"protocol": "MFNP", "version": 1.0, "sender": "bench",
+                       "message_type": message_type, "payload": payload}).encode()
+
+
+def call(base_url, method, path, body=None, content_type="application/json"):
+    """Returns (status, seconds, parsed JSON or None)"""
+    request = urllib.request.Request(base_url + path, data=body, method=method,
+                                     headers={"Content-Type": content_type} if body is not None else {})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=120) as response:
+            data = response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        data = e.read()
+        status = e.code
+    except OSError:
+        return 0, time.perf_counter() - start, None
+    elapsed = time.perf_counter() - start
+    try:
+        return status, elapsed, json.loads(data)
+    except ValueError:
+        return status, elapsed, None
+
+
+def run_load(name, make_request, requests, concurrency):
+    """make_request(i) -> (status, seconds, reply). Returns a result dict
+    and the replies"""
+    latencies, errors, replies = [], 0, []
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        status, elapsed, reply = make_request(i)
+        with lock:
+            if 200 <= status < 300:
+                latencies.append(elapsed)
+                replies.append(reply)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - start
+    result = {"endpoint": name, "concurrency": concurrency, "requests": requests, "errors": errors,
+              "throughput_rps": round(len(latencies) / wall, 2) if wall else None}
+    result.update(percentiles(latencies))
+    print(f"{name:<32} {result.get('p50_ms', '-'):>9} {result.get('p95_ms', '-'):>9} "
+          f"{result.get('p99_ms', '-'):>9} {result['throughput_rps']:>9} {errors:>6}")
+    return result, replies
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MoodFlix end-to-end benchmark")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=100, help="requests per log endpoint")
+    parser.add_argument("--inference-requests", type=int, default=40)
+    parser.add_argument("--log-rows", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--train-rows", type=int, default=1000, help="log size the model is trained on")
+    parser.add_argument("--frames", type=int, default=10)
+    parser.add_argument("--audio-seconds", type=float, default=3)
+    parser.add_argument("--audio-format", choices=["wav", "webm"], default="wav")
+    parser.add_argument("--binary", action="store_true", help="send /inference as MFNP v2")
+    parser.add_argument("--emotion-ms", type=float, default=20.0, help="stub model latency per batch")
+    parser.add_argument("--llm-delay", type=float, default=0.005, help="stub LLM seconds per token")
+    parser.add_argument("--llm-cache", action="store_true", help="keep the LLM answer cache on")
+    parser.add_argument("--output", help="write the results as JSON here")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary work directory")
+    args = parser.parse_args()
+
+    log_sizes = sorted(args.log_rows)
+    workdir = tempfile.mkdtemp(prefix="moodflix-bench-")
+    logs = {rows: synthetic.write_log(os.path.join(workdir, "logs", f"user_logs_{rows}.csv"), rows)
+            for rows in log_sizes}
+    synthetic.write_log(os.path.join(workdir, "tmp", "user_logs.csv"), args.train_rows, seed=1)
+
+    stub = ollama_stub.run_stub(port=0, delay=args.llm_delay)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{stub.server_address[1]}"
+
+    # server.py keeps its log and models under ./tmp
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    import_start = time.perf_counter()
+    import aiengine
+    import server
+    import_seconds = time.perf_counter() - import_start
+    with server.startup.phase("setup"):
+        server.setup()
+    # run_server trains the first model in its warm-up thread; do it here
+    with server.startup.phase("model"):
+        server.model_trainer.refresh()
+    aiengine.face_engine = StubEmotionEngine(aiengine.EMOTION_LABELS, args.emotion_ms)
+    if not args.llm_cache:
+        aiengine.llm_cache.ttl = 0
+    aiengine.llm_cache.path = None
+
+    httpd = server.MoodFlixServer(("127.0.0.1", 0), server.JetsonHandler)
+    server.JetsonHandler.log_message = lambda *a: None
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{httpd.server_address[1]}"
+
+    results = []
+    print(f"{'endpoint':<32} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'errors':>6}")
+    try:
+        payloads = []
+        for faces in (True, False):
+            payload = synthetic.inference_payload(args.frames, faces=faces, audio_seconds=args.audio_seconds,
+                                                  audio_format=args.audio_format, binary=args.binary)
+            payload["timings"] = True
+            if args.binary:
+                from mfnp import encode_v2, CONTENT_TYPE
+                payloads.append((encode_v2("inference", payload, sender="bench"), CONTENT_TYPE))
+            else:
+                payloads.append((mfnp("inference", payload), "application/json"))
+
+        result, replies = run_load(
+            "POST /inference",
+            lambda i: call(base_url, "POST", "/inference", *payloads[i % len(payloads)]),
+            args.inference_requests, args.concurrency)
+        result["log_rows"] = args.train_rows
+        results.append(result)
+        stage_samples = {}
+        for reply in replies:
+            for stage, ms in (reply or {}).get("payload", {}).get("timings", {}).items():
+                stage_samples.setdefault(stage, []).append(ms / 1e3)
+        stages = {stage: percentiles(samples) for stage, samples in sorted(stage_samples.items())}
+
+        for rows in log_sizes:
+            shutil.copy(logs[rows], "tmp/user_logs.next")
+            os.replace("tmp/user_logs.next", "tmp/user_logs.csv")
+            # one-off costs after the log changed, reported separately
+            start = time.perf_counter()
+            server.log_store.tail(1)
+            index_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            server.log_store.summary()
+            digest_seconds = time.perf_counter() - start
+
+            # a peer that misses the newest 10 rows
+            summary = {"buckets": logstore.summarize_rows(itertools.islice(synthetic.log_rows(rows), rows - 10))}
+            scenarios = [
+                ("GET /inference/log", lambda i: call(base_url, "GET", "/inference/log?limit=50")),
+                ("GET /inference/log?mood", lambda i: call(base_url, "GET", "/inference/log?limit=50&mood=sad&city=Busan")),
+                ("POST /inference/log", lambda i: call(base_url, "POST", "/inference/log", mfnp("inference-log", {
+                    "clientSentAt": f"2030-01-01T00:00:{i % 60:02d}Z", "movieTitle": f"Bench {i}",
+                    "mood": "happy", "tone": "neutral", "env": synthetic.environment(i)}))),
+                ("POST /sync sync-summary", lambda i: call(base_url, "POST", "/sync", mfnp("sync-summary", summary))),
+            ]
+            for name, make_request in scenarios:
+                requests = args.requests if "sync" not in name else max(1, args.requests // 10)
+                result, _ = run_load(f"{name} [{rows}]", make_request, requests, args.concurrency)
+                result["endpoint"] = name
+                result["log_rows"] = rows
+                if name == "GET /inference/log":
+                    result["index_build_ms"] = round(index_seconds * 1e3, 3)
+                if name == "POST /sync sync-summary":
+                    result["digest_build_ms"] = round(digest_seconds * 1e3, 3)
+                results.append(result)
+
+        print()
+        print(f"{'stage':<16} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'count':>6}")
+        for stage, s in stages.items():
+            print(f"{stage:<16} {s['p50_ms']:>9} {s['p95_ms']:>9} {s['p99_ms']:>9} {s['count']:>6}")
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        server.inference_pool.shutdown()
+        server.log_writer.stop()
+        server.log_store.close()
+        stub.shutdown()
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "import_seconds": round(import_seconds, 3),
+            "startup_phases": server.startup.status()["phases"],
+            "args": vars(args),
+        },
+        "results": results,
+        "stages": stages,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Parity check and microbenchmark for detect-then-track face localisation.
+
+Runs full-resolution Haar detection on every frame ("detect") and
+FaceTracker ("track") over bursts of synthetic face frames at a few
+resolutions, compares the boxes and times the localisation per frame
+(CLAHE excluded, both modes share it).
+
+    python3 bench/face_tracking.py [--frames 10] [--repeat 5]
+
+Exits with status 1 when the tracker misses a face the full detector
+finds, or its box overlaps the detector's by less than MIN_IOU.
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aiengine import enhanced_gray, face_cascade, largest_face, FaceTracker, FACE_MIN_SIZE
+from synthetic import face_frame
+
+SCALES = [1, 2, 3]  # 320x240, 640x480, 960x720
+MIN_IOU = 0.6
+
+
+def detect_full(gray):
+    with face_cascade() as cascade:
+        return largest_face(cascade.detectMultiScale(
+            gray, scaleFactor=1.1, minNeighbors=7, minSize=(FACE_MIN_SIZE, FACE_MIN_SIZE)))
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = w * h
+    return inter / float(aw * ah + bw * bh - inter)
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="face localisation parity and timing")
+    parser.add_argument("--frames", type=int, default=10, help="frames per burst")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'size':>9} {'found':>7} {'min IoU':>8} {'detect ms':>10} {'track ms':>9} {'speedup':>8}")
+    for scale in SCALES:
+        grays = []
+        for i in range(args.frames):
+            frame = face_frame(i)
+            if scale != 1:
+                frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+            grays.append(enhanced_gray(frame))
+
+        full = [detect_full(gray) for gray in grays]
+        tracker = FaceTracker()
+        tracked = [tracker.locate(gray) for gray in grays]
+        ious = []
+        for i, (a, b) in enumerate(zip(full, tracked)):
+            if a is None:
+                continue
+            if b is None:
+                failures.append(f"{grays[i].shape[1]}x{grays[i].shape[0]} frame {i}: face lost")
+                continue
+            ious.append(iou(a, b))
+        if ious and min(ious) < MIN_IOU:
+            failures.append(f"{grays[0].shape[1]}x{grays[0].shape[0]}: IoU {min(ious):.2f}")
+
+        detect = best_of(lambda: [detect_full(gray) for gray in grays], args.repeat) / len(grays)
+
+        def track():
+            tracker = FaceTracker()
+            for gray in grays:
+                tracker.locate(gray)
+        tracking = best_of(track, args.repeat) / len(grays)
+        found = sum(box is not None for box in tracked)
+        size = f"{grays[0].shape[1]}x{grays[0].shape[0]}"
+        print(f"{size:>9} {found:>3}/{sum(box is not None for box in full):<3} {min(ious, default=0):>8.2f} "
+              f"{detect * 1e3:>10.2f} {tracking * 1e3:>9.2f} {detect / tracking:>7.1f}x")
+
+    if failures:
+        print("\nParity check FAILED:")
+        for failure in failures:
+            print(" -", failure)
+        return 1
+    print("\nParity check passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
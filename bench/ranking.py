@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""Parity check and microbenchmark for the RandomForest ranking path.
+
+Trains a model on synthetic logs with catalogs of --movies sizes, then
+compares aiengine.classifier_ranking (dict-compiled FeatureEncoder, one
+NumPy row) with the former pandas version kept below as a reference, and
+times single-context ranking, batched classifier_rankings and
+merge_recommendations against the old list-scan dedupe.
+
+    python3 bench/ranking.py [--movies 200 1000 2000] [--contexts 64]
+
+The forest keeps a per-class value array in every node, about 500 bytes
+per training row and catalog title, so the training log of each size is
+capped at --max-cells rows x movies (~1 GB of trees by default) and the
+model is freed before the next size is trained.
+
+Exits with status 1 when a ranking differs from the reference.
+"""
+import argparse
+import gc
+import io
+import os
+import random
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aiengine import (classifier_ranking, classifier_rankings, merge_recommendations,
+                      train_on_user_data, RequestAnalysis)
+from logstore import LOG_HEADER
+import synthetic
+
+
+def safe_transform(le, value):
+    if value not in le.classes_:
+        return le.transform(["other"])[0]
+    return le.transform([value])[0]
+
+
+def classifier_ranking_pandas(clf_tuple, user_context, analysis):
+    """The one-row DataFrame version classifier_ranking replaced"""
+    clf, encoders = clf_tuple
+    le_city, le_today, le_tomorrow, le_weather, le_mood, le_tone, le_movie = encoders
+    env = user_context['environment']
+    df = pd.DataFrame([{
+        'latitude': env['lat'], 'longitude': env['lon'], 'temperature': env['temperature'],
+        'city': safe_transform(le_city, env['city']),
+        'today_status': safe_transform(le_today, env['today_status']),
+        'tomorrow_status': safe_transform(le_tomorrow, env['tomorrow_status']),
+        'weather_desc': safe_transform(le_weather, env['weather_desc']),
+        'mood': le_mood.transform([analysis.mood])[0],
+        'tone': le_tone.transform([analysis.tone])[0],
+    }]).astype(np.float64).to_numpy()
+    pred_probs = clf.predict_proba(df)[0]
+    return list(le_movie.inverse_transform(pred_probs.argsort()[::-1]))
+
+
+def merge_recommendations_scan(ranked_movies, primary_movies):
+    final_list = []
+    for movie in ranked_movies + primary_movies:
+        if movie not in final_list:
+            final_list.append(movie)
+    return final_list
+
+
+def training_log(rows, movies, seed=0):
+    # every title appears once before any repeats, so the model has
+    # min(rows, movies) classes
+    labels = [i % movies for i in range(rows)]
+    random.Random(seed).shuffle(labels)
+    out = io.StringIO()
+    out.write(",".join(LOG_HEADER) + "\n")
+    for row, label in zip(synthetic.log_rows(rows, seed), labels):
+        row[-1] = f"Movie {label}"
+        out.write(",".join(row) + "\n")
+    out.seek(0)
+    return pd.read_csv(out)
+
+
+def contexts(count):
+    rng = random.Random(1)
+    moods = synthetic.MOODS
+    out = []
+    for i in range(count):
+        env = synthetic.environment(i)
+        if i % 7 == 0:
+            env["city"] = "Nowhere"  # unseen value, encoded as "other"
+        out.append(({"environment": env},
+                    RequestAnalysis({"environment": env}, mood=rng.choice(moods), tone=rng.choice(synthetic.TONES))))
+    return out
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RandomForest ranking parity and timing")
+    parser.add_argument("--movies", type=int, nargs="+", default=[200, 1000, 2000])
+    parser.add_argument("--rows", type=int, default=5000, help="training log rows, at most")
+    parser.add_argument("--max-cells", type=int, default=2000000,
+                        help="cap on training rows x movies, which the forest's memory grows with")
+    parser.add_argument("--contexts", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # small logs of large catalogs have more classes than half the rows
+    warnings.filterwarnings("ignore", message="The number of unique classes")
+    failures = []
+    print(f"{'rows':>6} {'movies':>7} {'pandas us':>10} {'fast us':>9} {'batch us/ctx':>13} {'merge us':>9} {'scan us':>9}")
+    for movies in args.movies:
+        rows = max(1, min(args.rows, args.max_cells // movies))
+        clf_tuple = train_on_user_data(training_log(rows, movies))
+        requests = contexts(args.contexts)
+        for context, analysis in requests:
+            if classifier_ranking(clf_tuple, context, analysis) != classifier_ranking_pandas(clf_tuple, context, analysis):
+                failures.append(f"{movies} movies: ranking differs for {context['environment']}")
+                break
+        batch = classifier_rankings(clf_tuple, [c for c, _ in requests], [a for _, a in requests])
+        if batch != [classifier_ranking(clf_tuple, c, a) for c, a in requests]:
+            failures.append(f"{movies} movies: batched ranking differs")
+
+        context, analysis = requests[0]
+        ranked = classifier_ranking(clf_tuple, context, analysis)
+        primary = ranked[:3] + ["Minari", "Mother"]
+        n = len(requests)
+        ref = best_of(lambda: [classifier_ranking_pandas(clf_tuple, c, a) for c, a in requests], args.repeat) / n
+        fast = best_of(lambda: [classifier_ranking(clf_tuple, c, a) for c, a in requests], args.repeat) / n
+        batched = best_of(lambda: classifier_rankings(clf_tuple, [c for c, _ in requests],
+                                                      [a for _, a in requests]), args.repeat) / n
+        merge = best_of(lambda: merge_recommendations(ranked, primary), args.repeat)
+        scan = best_of(lambda: merge_recommendations_scan(ranked, primary), args.repeat)
+        if merge_recommendations(ranked, primary) != merge_recommendations_scan(ranked, primary):
+            failures.append(f"{movies} movies: merge differs")
+        print(f"{rows:>6} {len(ranked):>7} {ref * 1e6:>10.0f} {fast * 1e6:>9.0f} {batched * 1e6:>13.0f} "
+              f"{merge * 1e6:>9.0f} {scan * 1e6:>9.0f}")
+        # the next size's forest must not coexist with this one
+        del clf_tuple, requests, ranked, primary
+        gc.collect()
+
+    if failures:
+        print("\nParity check FAILED:")
+        for failure in failures:
+            print(" -", failure)
+        return 1
+    print("\nParity check passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""Synthetic inputs for the MoodFlix benchmarks.
+
+Builds MFNP /inference payloads from generated JPEG frames (a drawn face
+that the Haar cascade detects, or an empty background) and generated
+voice-like audio, plus user_logs.csv files of any size:
+
+    python3 bench/synthetic.py --out bench_data --log-rows 1000 100000 1000000
+
+writes bench_data/user_logs_<rows>.csv and bench_data/payload_<kind>.json.
+Everything is seeded, so two runs produce identical files.
+"""
+import argparse
+import base64
+import csv
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from logstore import LOG_HEADER
+
+SR = 16000
+FRAME_SIZE = (320, 240)
+CITIES = [("Seoul", 37.566, 126.978), ("Busan", 35.179, 129.075), ("Daegu", 35.871, 128.601),
+          ("Incheon", 37.456, 126.705), ("Gwangju", 35.160, 126.851)]
+WEATHER = ["clear sky", "few clouds", "broken clouds", "overcast clouds", "light rain", "mist", "snow"]
+MOODS = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+TONES = ["happy", "sad", "neutral"]
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+MOVIES = [f"Movie {i}" for i in range(200)] + ["Minari", "Memories of Murder", "A Taxi Driver", "Mother", "Paddington 2"]
+AUDIO_SECONDS = [1, 3, 5]
+
+
+def synthetic_voice(seconds, f0=150.0, sr=SR, seed=0):
+    """Harmonic tone with vibrato, syllable-like amplitude envelope,
+    short pauses and a little noise"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    inst_f0 = f0 + 0.1 * f0 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(inst_f0) / sr
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = np.clip(np.sin(2 * np.pi * 2 * t), 0, None) ** 0.5
+    y = voice * envelope + 0.01 * rng.standard_normal(len(t))
+    return y.astype(np.float32)
+
+
+def face_frame(seed=0):
+    """A drawn frontal face on a plain background; detected by the
+    default Haar cascade"""
+    rng = np.random.default_rng(seed)
+    w, h = FRAME_SIZE
+    img = np.full((h, w, 3), int(rng.integers(60, 120)), np.uint8)
+    cx, cy, r = w // 2 + int(rng.integers(-10, 10)), h // 2, 70
+    cv2.ellipse(img, (cx, cy), (int(r * 0.8), r), 0, 0, 360, (150, 170, 205), -1)
+    for dx in (-25, 25):
+        cv2.ellipse(img, (cx + dx, cy - 18), (12, 6), 0, 0, 360, (255, 255, 255), -1)
+        cv2.circle(img, (cx + dx, cy - 18), 5, (40, 30, 20), -1)
+        cv2.line(img, (cx + dx - 14, cy - 32), (cx + dx + 14, cy - 34), (40, 30, 20), 3)
+    cv2.line(img, (cx, cy - 10), (cx - 5, cy + 12), (110, 120, 160), 2)
+    cv2.ellipse(img, (cx, cy + 30), (22, 8), 0, 0, 180, (60, 60, 150), -1)
+    return img
+
+
+def empty_frame(seed=0):
+    """Smooth noise with no face in it"""
+    rng = np.random.default_rng(seed)
+    w, h = FRAME_SIZE
+    small = rng.integers(0, 255, (h // 16, w // 16, 3), dtype=np.uint8)
+    return cv2.resize(small, (w, h), interpolation=cv2.INTER_CUBIC)
+
+
+def jpeg(frame, quality=85):
+    ok, data = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return data.tobytes()
+
+
+def frames(count, faces=True, seed=0):
+    """JPEG bytes of `count` frames. Consecutive frames differ slightly
+    so they are not all dropped as duplicates"""
+    make = face_frame if faces else empty_frame
+    return [jpeg(make(seed + i)) for i in range(count)]
+
+
+def wav_bytes(seconds, sr=SR):
+    buf = io.BytesIO()
+    sf.write(buf, synthetic_voice(seconds, sr=sr), sr, format="WAV", subtype="PCM_16")
+    return buf.getvalue()
+
+
+def webm_bytes(seconds, sr=SR):
+    """Opus in WebM like browsers record, or None without ffmpeg"""
+    if shutil.which("ffmpeg") is None:
+        return None
+    result = subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-f", "wav", "-i", "pipe:0", "-c:a", "libopus", "-f", "webm", "pipe:1"],
+        input=wav_bytes(seconds, sr), capture_output=True)
+    return result.stdout if result.returncode == 0 else None
+
+
+def environment(seed=0):
+    rng = random.Random(seed)
+    city, lat, lon = rng.choice(CITIES)
+    return {
+        "city": city,
+        "lat": f"{lat:.3f}",
+        "lon": f"{lon:.3f}",
+        "today_status": rng.choice(["Weekday", "Weekend"]),
+        "tomorrow_status": rng.choice(["Weekday", "Weekend"]),
+        "weekday": rng.choice(WEEKDAYS),
+        "weather_desc": rng.choice(WEATHER),
+        "temperature": f"{rng.uniform(-5, 30):.1f}",
+    }
+
+
+def inference_payload(num_frames=10, faces=True, audio_seconds=3, audio_format="wav", binary=False, seed=0):
+    """MFNP "inference" payload. binary: frames and audio as bytes for
+    an MFNP v2 body, otherwise base64 strings for v1 JSON"""
+    images = frames(num_frames, faces=faces, seed=seed)
+    audio = webm_bytes(audio_seconds) if audio_format == "webm" else wav_bytes(audio_seconds)
+    if audio is None:
+        raise RuntimeError("webm audio needs ffmpeg")
+    if not binary:
+        images = [base64.b64encode(image).decode() for image in images]
+        audio = f"data:audio/{audio_format};base64," + base64.b64encode(audio).decode()
+    return {"environment": environment(seed), "images": images, "audio": audio}
+
+
+def log_rows(count, seed=0):
+    """`count` rows in the user_logs.csv layout, oldest first"""
+    rng = random.Random(seed)
+    ts = datetime(2025, 1, 1)
+    for _ in range(count):
+        ts += timedelta(seconds=rng.randint(30, 3600))
+        city, lat, lon = rng.choice(CITIES)
+        yield [
+            ts.isoformat(sep=" "), city, f"{lat:.3f}", f"{lon:.3f}",
+            rng.choice(["Weekday", "Weekend"]), rng.choice(["Weekday", "Weekend"]),
+            WEEKDAYS[ts.weekday()], rng.choice(WEATHER), f"{rng.uniform(-5, 30):.1f}",
+            rng.choice(MOODS), rng.choice(TONES), rng.choice(MOVIES),
+        ]
+
+
+def write_log(path, count, seed=0):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, mode="w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(LOG_HEADER)
+        writer.writerows(log_rows(count, seed))
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="write synthetic MoodFlix benchmark inputs")
+    parser.add_argument("--out", default="bench_data")
+    parser.add_argument("--log-rows", type=int, nargs="*", default=[1000, 100000, 1000000])
+    parser.add_argument("--frames", type=int, default=10)
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for rows in args.log_rows:
+        path = write_log(os.path.join(args.out, f"user_logs_{rows}.csv"), rows)
+        print(f"{path}: {rows} rows, {os.path.getsize(path) / 1e6:.1f} MB")
+
+    kinds = {"faces": True, "nofaces": False}
+    for name, faces in kinds.items():
+        for seconds in AUDIO_SECONDS:
+            payload = inference_payload(args.frames, faces=faces, audio_seconds=seconds)
+            path = os.path.join(args.out, f"payload_{name}_{seconds}s.json")
+            with open(path, "w") as f:
+                json.dump({"protocol": "MFNP", "version": 1.0, "sender": "bench",
+                           "message_type": "inference", "payload": payload}, f)
+            print(f"{path}: {os.path.getsize(path) / 1e3:.0f} kB")
+
+
+if __name__ == "__main__":
+    main()
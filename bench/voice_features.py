@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Parity check and microbenchmark for the voice feature extractor.
+
+Compares aiengine.extract_audio_features (one framing, one STFT) with the
+librosa reference extract_audio_features_librosa on synthetic voice-like
+clips, then times both for clip lengths from 1 s to 30 s.
+
+    python3 bench/voice_features.py [--repeat 5]
+
+Exits with status 1 when any of RMS, pitch (piptrack's mean peak
+frequency), ZCR or spectral centroid drifts more than PARITY_TOLERANCE
+from the librosa numbers, or when the tone label the voice rules give for
+the two feature sets differs.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aiengine import extract_audio_features, extract_audio_features_librosa, voice_tone_from_features
+from synthetic import synthetic_voice, SR
+
+CLIP_SECONDS = [1, 2, 5, 10, 30]
+PARITY_TOLERANCE = 0.01  # relative
+
+
+def parity_clips():
+    """(name, clip) pairs covering low and high voices and a mostly
+    silent clip, so more than one tone label is exercised"""
+    clips = [(f"{f0:.0f}Hz", synthetic_voice(5, f0=f0)) for f0 in (85.0, 110.0, 150.0, 220.0)]
+    quiet = synthetic_voice(5, f0=110.0)
+    # a short loud start, then near silence
+    quiet[len(quiet) // 40:] *= 0.002
+    clips.append(("quiet", quiet))
+    return clips
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="voice feature parity and timing")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'clip':>6} {'feature':>9} {'fast':>10} {'librosa':>10} {'rel diff':>9}")
+    for clip, y in parity_clips():
+        fast = extract_audio_features(y, SR)
+        ref = extract_audio_features_librosa(y, SR)
+        for name, a, b in zip(("rms", "pitch", "zcr", "centroid"), fast, ref):
+            a, b = float(a), float(b)
+            diff = abs(a - b) / (abs(b) + 1e-12)
+            print(f"{clip:>6} {name:>9} {a:>10.4f} {b:>10.4f} {diff:>9.4f}")
+            if diff > PARITY_TOLERANCE:
+                failures.append(f"{name} for {clip}: {a} vs {b}")
+        tone, ref_tone = voice_tone_from_features(*fast), voice_tone_from_features(*ref)
+        print(f"{clip:>6} {'tone':>9} {tone:>10} {ref_tone:>10}")
+        if tone != ref_tone:
+            failures.append(f"tone for {clip}: {tone} vs {ref_tone}")
+
+    print()
+    print(f"{'clip s':>6} {'fast ms':>9} {'librosa ms':>11} {'speedup':>8}")
+    for seconds in CLIP_SECONDS:
+        y = synthetic_voice(seconds)
+        # first calls pay librosa/numba and FFT plan setup
+        extract_audio_features(y, SR)
+        extract_audio_features_librosa(y, SR)
+        fast = best_of(lambda: extract_audio_features(y, SR), args.repeat)
+        ref = best_of(lambda: extract_audio_features_librosa(y, SR), args.repeat)
+        print(f"{seconds:>6} {fast * 1e3:>9.2f} {ref * 1e3:>11.2f} {ref / fast:>7.1f}x")
+
+    if failures:
+        print("\nParity check FAILED:")
+        for failure in failures:
+            print(" -", failure)
+        return 1
+    print("\nParity check passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""Process-pool backend for the CPU-bound inference stages.
+
+With aiengine.INFERENCE_BACKEND = "process", score_frames and
+estimate_voice_emotion hand their work to a pool of worker processes
+instead of running in the server process, so face scoring and voice
+features of concurrent requests use more than one core. Each worker loads
+the emotion model, Haar cascade and CLAHE once when it starts, and is
+replaced after TASKS_PER_WORKER tasks to bound the memory the TensorFlow
+backend accumulates.
+
+Decoded frames and audio reach a worker through one
+multiprocessing.shared_memory block per task: only the block's name and
+the array layout are pickled. Frame results come back as two small
+arrays, emotion codes (-1 where no face was scored) and confidences,
+along with the per-stage timings measured in the worker.
+"""
+import multiprocessing
+import os
+import signal
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import aiengine
+import metrics
+
+PROCESSES = int(os.environ.get("MOODFLIX_INFERENCE_PROCESSES", "2"))
+# tasks a worker runs before it is replaced by a fresh process
+TASKS_PER_WORKER = int(os.environ.get("MOODFLIX_INFERENCE_TASKS_PER_WORKER", "200"))
+# seconds to wait for a task; a worker that died never answers
+TASK_TIMEOUT = 60.0
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pack(arrays):
+    """Copies arrays into one new shared memory block.
+    Returns (block, layout) with layout [(offset, shape, dtype), ...]"""
+    block = shared_memory.SharedMemory(create=True, size=max(1, sum(a.nbytes for a in arrays)))
+    layout = []
+    offset = 0
+    for a in arrays:
+        np.ndarray(a.shape, a.dtype, buffer=block.buf, offset=offset)[...] = a
+        layout.append((offset, a.shape, a.dtype.str))
+        offset += a.nbytes
+    return block, layout
+
+
+def attach(name, layout):
+    """The arrays of a block made by pack(), as views without a copy"""
+    block = shared_memory.SharedMemory(name=name)
+    arrays = [np.ndarray(shape, np.dtype(dtype), buffer=block.buf, offset=offset)
+              for offset, shape, dtype in layout]
+    return block, arrays
+
+
+def _init_worker():
+    # Ctrl-C reaches the whole process group; the server shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    aiengine.INFERENCE_BACKEND = "thread"
+    # one process per core already, so no frame threads on top
+    aiengine.FRAME_WORKERS = 1
+    aiengine.get_clahe()
+    with aiengine.face_cascade():
+        pass
+    try:
+        aiengine.face_engine.model
+    except Exception as e:
+        print(f"Inference worker {os.getpid()} cannot load the emotion model: {e}")
+
+
+def _run_task(task, name, layout, *args):
+    """Runs task(arrays, *args) on a shared block in a worker.
+    Returns (result, {stage: seconds})"""
+    block, arrays = attach(name, layout)
+    timings = metrics.begin_request()
+    try:
+        return task(arrays, *args), dict(timings.stages)
+    finally:
+        metrics.end_request()
+        # the views must be gone before the block can be closed. One may
+        # outlive this (e.g. held by the traceback of the task's error);
+        # then close() raises BufferError, which must not replace the
+        # task's own exception. The mapping goes when the view does
+        del arrays
+        try:
+            block.close()
+        except BufferError as e:
+            print(f"Inference worker {os.getpid()} cannot close {name} yet: {e}")
+
+
+def _score_frames_task(frames, tracker_state):
+    tracker = aiengine.FaceTracker()
+    tracker.box, tracker.tracked = tracker_state
+    results = aiengine.score_frames(frames, tracker)
+    codes = np.full(len(results), -1, dtype=np.int8)
+    confidences = np.zeros(len(results), dtype=np.float32)
+    for i, result in enumerate(results):
+        if result is not None:
+            codes[i] = aiengine.EMOTION_LABELS.index(result[0])
+            confidences[i] = result[1]
+    return codes, confidences, (tracker.box, tracker.tracked)
+
+
+def _voice_tone_task(arrays, sr):
+    return aiengine.estimate_voice_emotion(arrays[0], sr)
+
+
+def _ping(_):
+    return os.getpid()
+
+
+def pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn: forking a process that runs threads (and maybe
+                # TensorFlow) is not safe
+                context = multiprocessing.get_context("spawn")
+                _pool = context.Pool(PROCESSES, initializer=_init_worker, maxtasksperchild=TASKS_PER_WORKER)
+    return _pool
+
+
+def _submit(task, arrays, *args):
+    block, layout = pack(arrays)
+    try:
+        result, stages = pool().apply_async(_run_task, (task, block.name, layout) + args).get(TASK_TIMEOUT)
+    finally:
+        block.close()
+        block.unlink()
+    for stage, seconds in stages.items():
+        metrics.record(stage, seconds)
+    return result
+
+
+def score_frames(frames, tracker):
+    """aiengine.score_frames on a worker. tracker is updated in place"""
+    if not frames:
+        return []
+    codes, confidences, tracker_state = _submit(_score_frames_task, frames, (tracker.box, tracker.tracked))
+    tracker.box, tracker.tracked = tracker_state
+    return [None if code < 0 else (aiengine.EMOTION_LABELS[code], float(confidence))
+            for code, confidence in zip(codes.tolist(), confidences.tolist())]
+
+
+def voice_tone(audio_data, sr):
+    """aiengine.estimate_voice_emotion on a worker"""
+    return _submit(_voice_tone_task, [np.ascontiguousarray(audio_data, dtype=np.float32)], sr)
+
+
+def warm_up():
+    """Starts the workers; returns once a worker has loaded its models.
+    Returns the pids that answered"""
+    return set(pool().map(_ping, range(PROCESSES), chunksize=1))
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool.join()
+            _pool = None
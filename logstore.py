@@ -0,0 +1,581 @@
+#!/usr/bin/env python3
+"""Indexed access to the append-only user log (tmp/user_logs.csv).
+
+The CSV stays the source of truth, so train_on_user_data and /sync keep
+reading it as before. LogStore keeps the byte offset of every row in
+memory, which turns "last N rows" into one seek and one read of N rows
+instead of parsing the whole file. The index is built by one pass over
+the file and then extended on every append; a log replaced or truncated
+behind the store's back (a /sync rewrite) is noticed from its inode and
+size, and re-indexed.
+"""
+import csv
+import hashlib
+import io
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from array import array
+from datetime import datetime, timezone
+
+import numpy as np
+
+# header written by the training export, in the order read by train_on_user_data
+LOG_HEADER = ["timestamp", "city", "latitude", "longitude", "today_status", "tomorrow_status",
+              "weekday", "weather_desc", "temperature", "mood", "voice_tone", "movie_selected"]
+# the same columns as named in /inference/log payloads
+LOG_FIELDS = ["clientSentAt", "city", "lat", "lon", "today_status", "tomorrow_status",
+              "weekday", "weather_desc", "temperature", "mood", "tone", "movieTitle"]
+
+SCAN_BLOCK = 8 << 20  # bytes read per step while indexing
+QUERY_BLOCK = 1024  # rows parsed per step while filtering
+
+
+def row_to_log(row):
+    return dict(zip(LOG_FIELDS, row))
+
+
+# "Z" suffix and the fraction length are normalised here, since
+# datetime.fromisoformat only accepts them itself from Python 3.11
+_TS_FRACTION = re.compile(r"\.(\d+)")
+_TS_ZULU = re.compile(r"[zZ]$")
+
+
+def parse_timestamp(value):
+    """Log timestamps are ISO-like ("2025-11-09 05:26:11.37", "2025-10-01T12:00:00Z").
+    Returns a naive UTC datetime, or None when unparseable"""
+    text = _TS_ZULU.sub("+00:00", str(value).strip())
+    text = _TS_FRACTION.sub(lambda m: "." + m.group(1)[:6].ljust(6, "0"), text, count=1)
+    try:
+        ts = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def csv_row(row):
+    """The row's fields as the strings csv.writer stores: None becomes ""
+    and anything else str(value)"""
+    return ["" if value is None else value if isinstance(value, str) else str(value) for value in row]
+
+
+def row_digest(row):
+    """64-bit digest of a row's field values as stored in the CSV,
+    independent of CSV quoting"""
+    return int.from_bytes(hashlib.blake2b("\x1f".join(csv_row(row)).encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def row_day(row):
+    """Day bucket of a row as a date ordinal, 0 when the timestamp is unparseable"""
+    ts = parse_timestamp(row[0]) if row else None
+    return ts.toordinal() if ts else 0
+
+
+def day_name(ordinal):
+    return datetime.fromordinal(ordinal).date().isoformat() if ordinal else "undated"
+
+
+def day_ordinal(name):
+    """Inverse of day_name, None for a malformed day"""
+    if name == "undated":
+        return 0
+    try:
+        return datetime.fromisoformat(name).toordinal()
+    except (TypeError, ValueError):
+        return None
+
+
+def summarize(days, digests):
+    """Per-day bucket summary {day: [row count, digest]} of parallel arrays
+    of row days and row digests. A bucket digest is the sum of its row
+    digests mod 2**64, so it does not depend on row order"""
+    days = np.asarray(days, dtype=np.int64)
+    digests = np.asarray(digests, dtype=np.uint64)
+    if not len(days):
+        return {}
+    order = np.argsort(days, kind="stable")
+    days, digests = days[order], digests[order]
+    starts = np.flatnonzero(np.concatenate(([True], days[1:] != days[:-1])))
+    counts = np.diff(np.append(starts, len(days)))
+    sums = np.add.reduceat(digests, starts)
+    return {day_name(int(days[i])): [int(n), f"{int(h):016x}"] for i, n, h in zip(starts, counts, sums)}
+
+
+def summarize_rows(rows):
+    days, digests = array("q"), array("Q")
+    for row in rows:
+        days.append(row_day(row))
+        digests.append(row_digest(row))
+    return summarize(days, digests)
+
+
+def plan_delta(local_rows, reply):
+    """Peer side of a delta sync. local_rows: every local row; reply: the
+    payload of the server's "sync-summary" answer. Returns (rows the
+    server lacks, digests of server rows missing locally) for the
+    "sync-delta" message"""
+    days = {day: set(int(d, 16) for d in digests) for day, digests in reply["days"].items()}
+    local = set()
+    send = []
+    for row in local_rows:
+        day = day_name(row_day(row))
+        if day not in days:
+            continue
+        digest = row_digest(row)
+        local.add(digest)
+        if digest not in days[day]:
+            send.append(row)
+    want = [f"{d:016x}" for digests in days.values() for d in digests if d not in local]
+    return send, want
+
+
+def record_ends(data, in_quotes=False):
+    """Offsets just past each row terminator in data. A newline ends a row
+    only outside a quoted field, i.e. after an even number of quotes
+    (escaped quotes come in pairs). Returns (ends, in_quotes at the end)"""
+    buf = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(buf == 0x0A)
+    quotes = np.flatnonzero(buf == 0x22)
+    # quotes seen before each newline
+    parity = (np.searchsorted(quotes, newlines) + in_quotes) % 2
+    ends = newlines[parity == 0] + 1
+    return ends, bool((len(quotes) + in_quotes) % 2)
+
+
+class LogStore:
+
+    def __init__(self, path, lock=None):
+        """lock: serialises writers to path; shared with everything else
+        that reads or rewrites the log. Must be reentrant"""
+        self.path = path
+        self.lock = lock or threading.RLock()
+        self._file = None  # append handle, kept open between writes
+        self._reset()
+
+    def _reset(self, inode=None):
+        self._offsets = array("q")  # start of every data row
+        self._indexed = 0  # end of the last indexed row
+        self._header = False
+        self._unterminated = False
+        self._inode = inode
+        # delta sync state, filled lazily for the first len(self._digests) rows
+        self._digests = array("Q")
+        # the same digests as a set, built on the first append_missing and
+        # then kept in step with _digests
+        self._digest_set = None
+        self._days = array("q")
+        # changes whenever the index is rebuilt, so watermarks from
+        # before a rewrite or restart are recognised as stale
+        self.generation = uuid.uuid4().hex[:12]
+
+    def _scan(self, size):
+        """Indexes rows between self._indexed and size"""
+        with open(self.path, "rb") as f:
+            f.seek(self._indexed)
+            pos = self._indexed
+            in_quotes = False
+            pending = pos  # start of the row being scanned
+            while pos < size:
+                block = f.read(min(SCAN_BLOCK, size - pos))
+                if not block:
+                    break
+                ends, in_quotes = record_ends(block, in_quotes)
+                if len(ends):
+                    ends = ends.astype(np.int64) + pos
+                    self._add_rows(np.concatenate(([pending], ends[:-1])), ends)
+                    pending = int(ends[-1])
+                pos += len(block)
+        self._unterminated = pending < pos
+        if self._unterminated:
+            # last row without a terminator (hand-edited file)
+            self._add_rows(np.array([pending]), np.array([pos]))
+            pending = pos
+        self._indexed = pending
+
+    def _add_rows(self, starts, ends):
+        if starts[0] == 0:
+            # a header is only ever the first row
+            with open(self.path, "rb") as f:
+                first = f.read(min(int(ends[0]), 4096)).decode("utf-8", "replace")
+            if first.split(",", 1)[0].strip() == LOG_HEADER[0]:
+                self._header = True
+                starts, ends = starts[1:], ends[1:]
+        # blank lines are not rows
+        self._offsets.extend(starts[ends - starts > 2].tolist())
+
+    def _sync(self):
+        """Brings the index up to date with the file on disk"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._close_file()
+            self._reset()
+            return
+        if st.st_ino != self._inode or st.st_size < self._indexed:
+            self._close_file()
+            self._reset(st.st_ino)
+        if st.st_size > self._indexed:
+            self._scan(st.st_size)
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def invalidate(self):
+        """Forces a re-index; for callers that rewrote the log in place"""
+        with self.lock:
+            self._close_file()
+            self._reset()
+
+    def close(self):
+        with self.lock:
+            self._close_file()
+
+    def __len__(self):
+        with self.lock:
+            self._sync()
+            return len(self._offsets)
+
+    def append(self, row):
+        self.append_many([row])
+
+    def append_many(self, rows, fsync=False):
+        """Appends rows with one write. fsync: also force them to disk"""
+        if not rows:
+            return
+        rows = [csv_row(row) for row in rows]
+        with self.lock:
+            self._sync()
+            # digests first: nothing after the write may fail, or the index
+            # would fall out of step with the file
+            digested = len(self._digests) == len(self._offsets)
+            if digested:
+                digests = [row_digest(row) for row in rows]
+                days = [row_day(row) for row in rows]
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, "ab")
+                self._inode = os.fstat(self._file.fileno()).st_ino
+            text = io.StringIO()
+            writer = csv.writer(text)
+            lines = []
+            for row in rows:
+                text.seek(0)
+                text.truncate()
+                writer.writerow(row)
+                lines.append(text.getvalue().encode("utf-8"))
+            start = self._indexed
+            if self._unterminated:
+                self._file.write(b"\r\n")
+                start += 2
+            self._file.write(b"".join(lines))
+            self._file.flush()
+            if fsync:
+                os.fsync(self._file.fileno())
+            self._unterminated = False
+
+            starts = []
+            for line in lines:
+                starts.append(start)
+                start += len(line)
+            self._offsets.extend(starts)
+            self._indexed = start
+            if digested:
+                self._digests.extend(digests)
+                self._days.extend(days)
+                if self._digest_set is not None:
+                    self._digest_set.update(digests)
+
+    def fsync(self):
+        with self.lock:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+
+    def _read_rows(self, first, last):
+        """Rows first..last-1 (index positions), oldest first"""
+        if first >= last:
+            return []
+        end = self._offsets[last] if last < len(self._offsets) else self._indexed
+        with open(self.path, "rb") as f:
+            f.seek(self._offsets[first])
+            data = f.read(end - self._offsets[first])
+        return [row for row in csv.reader(io.StringIO(data.decode("utf-8", "replace"), newline="")) if row]
+
+    def tail(self, limit):
+        """The last `limit` rows, oldest first, read in O(limit).
+        limit <= 0 returns every row"""
+        with self.lock:
+            self._sync()
+            count = len(self._offsets)
+            first = max(0, count - limit) if limit > 0 else 0
+            return self._read_rows(first, count)
+
+    def query(self, limit=50, since=None, until=None, mood=None, city=None):
+        """The newest `limit` rows matching every given filter, oldest first.
+        since/until: datetimes (inclusive) compared with the row timestamp
+        mood/city: matched case-insensitively
+        Rows are scanned newest first and the scan stops once `limit`
+        rows matched; limit <= 0 returns every match"""
+        if since is None and until is None and mood is None and city is None:
+            return self.tail(limit)
+        mood = mood.lower() if mood else None
+        city = city.lower() if city else None
+
+        matched = []
+        with self.lock:
+            self._sync()
+            last = len(self._offsets)
+            if limit <= 0:
+                limit = last
+            while last > 0 and len(matched) < limit:
+                first = max(0, last - QUERY_BLOCK)
+                block = self._read_rows(first, last)
+                for row in reversed(block):
+                    if len(row) < len(LOG_FIELDS):
+                        continue
+                    if mood and row[9].lower() != mood:
+                        continue
+                    if city and row[1].lower() != city:
+                        continue
+                    if since is not None or until is not None:
+                        ts = parse_timestamp(row[0])
+                        if ts is None or (since and ts < since) or (until and ts > until):
+                            continue
+                    matched.append(row)
+                    if len(matched) == limit:
+                        break
+                last = first
+        matched.reverse()
+        return matched
+
+    def rows(self):
+        """Every data row, oldest first (the header is skipped)"""
+        with self.lock:
+            self._sync()
+            inode, count = self._inode, len(self._offsets)
+        for first in range(0, count, QUERY_BLOCK):
+            # the lock is held per block only, so appends are not stalled
+            # by a long export; a rewritten log ends the iteration
+            with self.lock:
+                self._sync()
+                if self._inode != inode or len(self._offsets) < count:
+                    return
+                block = self._read_rows(first, min(count, first + QUERY_BLOCK))
+            yield from block
+
+    def export_csv(self, out):
+        """Writes LOG_HEADER and every complete row to the text stream out,
+        in the layout train_on_user_data reads. Returns the row count"""
+        writer = csv.writer(out)
+        writer.writerow(LOG_HEADER)
+        count = 0
+        for row in self.rows():
+            if len(row) < len(LOG_HEADER):
+                continue
+            writer.writerow(row[:len(LOG_HEADER)])
+            count += 1
+        return count
+
+    # delta sync
+
+    def _update_digests(self):
+        count = len(self._offsets)
+        for first in range(len(self._digests), count, QUERY_BLOCK):
+            for row in self._read_rows(first, min(count, first + QUERY_BLOCK)):
+                digest = row_digest(row)
+                self._digests.append(digest)
+                self._days.append(row_day(row))
+                if self._digest_set is not None:
+                    self._digest_set.add(digest)
+
+    def watermark(self):
+        with self.lock:
+            self._sync()
+            return {"log": self.generation, "rows": len(self._offsets)}
+
+    def summary(self):
+        """Per-day bucket summary of the whole log, see summarize()"""
+        with self.lock:
+            self._sync()
+            self._update_digests()
+            return summarize(self._days, self._digests)
+
+    def day_digests(self, days):
+        """{day: [row digests]} for the given day names"""
+        ordinals = {day_ordinal(day): day for day in days}
+        ordinals.pop(None, None)
+        result = {day: [] for day in ordinals.values()}
+        with self.lock:
+            self._sync()
+            self._update_digests()
+            row_days = np.frombuffer(self._days, dtype=np.int64)
+            digests = np.frombuffer(self._digests, dtype=np.uint64)
+            for i in np.flatnonzero(np.isin(row_days, list(ordinals))):
+                result[ordinals[int(row_days[i])]].append(f"{int(digests[i]):016x}")
+        return result
+
+    def rows_for_digests(self, digests):
+        wanted = np.array([int(d, 16) for d in digests], dtype=np.uint64)
+        rows = []
+        with self.lock:
+            self._sync()
+            self._update_digests()
+            for i in np.flatnonzero(np.isin(np.frombuffer(self._digests, dtype=np.uint64), wanted)):
+                rows.extend(self._read_rows(int(i), int(i) + 1))
+        return rows
+
+    def rows_since(self, watermark):
+        """Rows appended after watermark, or None when it is stale"""
+        with self.lock:
+            self._sync()
+            if not watermark or watermark.get("log") != self.generation:
+                return None
+            start = int(watermark.get("rows", 0))
+            if not 0 <= start <= len(self._offsets):
+                return None
+            return self._read_rows(start, len(self._offsets))
+
+    def append_missing(self, rows):
+        """Appends the rows whose digest is not in the log yet (nor earlier
+        in rows) with one synced write. Returns (added, skipped)"""
+        missing = []
+        with self.lock:
+            self._sync()
+            self._update_digests()
+            if self._digest_set is None:
+                self._digest_set = set(self._digests)
+            present = self._digest_set
+            batch = set()
+            for row in rows:
+                row = csv_row(row)
+                digest = row_digest(row)
+                if digest in present or digest in batch or len(row) < len(LOG_FIELDS):
+                    continue
+                batch.add(digest)
+                missing.append(row)
+            self.append_many(missing, fsync=True)
+        return len(missing), len(rows) - len(missing)
+
+
+class _Commit:
+    __slots__ = ("row", "done", "error")
+
+    def __init__(self, row):
+        self.row = row
+        self.done = threading.Event()
+        self.error = None
+
+
+class GroupCommitWriter:
+    """Batches appends to a LogStore. Rows queued by concurrent callers are
+    written together once `batch_size` rows are waiting or the oldest has
+    waited `flush_interval` seconds; each caller blocks until its batch is
+    on disk.
+    fsync: "always" syncs every batch, "interval" at most once per
+    fsync_interval seconds, "never" leaves it to the OS"""
+
+    def __init__(self, store, batch_size=64, flush_interval=0.05, fsync="interval", fsync_interval=1.0):
+        if fsync not in ("always", "interval", "never"):
+            raise ValueError(f"unknown fsync policy {fsync!r}")
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._last_fsync = time.monotonic()
+        self._stats_lock = threading.Lock()
+        self.flushes = 0
+        self.rows_written = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def write(self, row, timeout=None):
+        """Queues row and waits until it is committed. Raises whatever the
+        write raised"""
+        self.start()
+        commit = _Commit(row)
+        self._queue.put(commit)
+        if not commit.done.wait(timeout):
+            raise TimeoutError("log write not committed in time")
+        if commit.error is not None:
+            raise commit.error
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+            if stop:
+                break
+
+    def _flush(self, batch):
+        start = time.monotonic()
+        fsync = self.fsync == "always" or (self.fsync == "interval" and start - self._last_fsync >= self.fsync_interval)
+        error = None
+        try:
+            self.store.append_many([c.row for c in batch], fsync=fsync)
+            if fsync:
+                self._last_fsync = start
+        except Exception as e:
+            print(f"Log write of {len(batch)} rows failed: {e}")
+            error = e
+        elapsed = time.monotonic() - start
+        with self._stats_lock:
+            self.flushes += 1
+            if error is None:
+                self.rows_written += len(batch)
+            self.flush_seconds_total += elapsed
+            self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+        for commit in batch:
+            commit.error = error
+            commit.done.set()
+
+    def stop(self):
+        """Flushes everything queued so far, with an fsync, and stops"""
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+        if self.fsync != "never":
+            self.store.fsync()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "flushes": self.flushes,
+                "rows_written": self.rows_written,
+                "avg_flush_ms": round(1e3 * self.flush_seconds_total / self.flushes, 3) if self.flushes else None,
+                "max_flush_ms": round(1e3 * self.flush_seconds_max, 3),
+                "fsync": self.fsync,
+            }
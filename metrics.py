@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""Per-stage latency histograms and counters for the inference hot path.
+
+Stages are timed with `with timed("stage"):`. Every timing goes into a
+fixed-bucket histogram, which costs a bisect and three additions under a
+lock, and GET /metrics renders them in the Prometheus text format. A
+request that called begin_request() also collects its own per-stage
+totals, which /inference returns when the payload asks for "timings".
+Work handed to a thread pool keeps reporting to the request that
+submitted it when the callable is wrapped with propagate().
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# seconds; the DeepFace and LLM stages live in the upper buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGES = ("json_parse", "frame_decode", "clahe", "haar_detect", "face_track", "deepface", "audio_decode",
+          "voice_features", "llm", "rf_predict", "merge")
+
+
+class Histogram:
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class RequestTimings:
+    """Per-stage totals of one request. Stages that run per frame on
+    several threads add up, so they report summed work, not wall time"""
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def as_ms(self):
+        with self._lock:
+            return {stage: round(seconds * 1e3, 3) for stage, seconds in self.stages.items()}
+
+
+class Registry:
+
+    def __init__(self):
+        self.histograms = {stage: Histogram() for stage in STAGES}
+        self.counters = {}  # (name, labels) -> value
+        self.gauges = {}  # name -> (help, fn, label)
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(stage, Histogram())
+        histogram.observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def gauge(self, name, fn, help_text="", label=None):
+        """fn is called at scrape time and returns a number, or with label
+        set a {label value: number} dict rendered as one sample each"""
+        self.gauges[name] = (help_text, fn, label)
+
+    def render(self):
+        lines = [
+            "# HELP moodflix_stage_seconds Time spent per inference stage",
+            "# TYPE moodflix_stage_seconds histogram",
+        ]
+        for stage, histogram in list(self.histograms.items()):
+            counts, total, count = histogram.snapshot()
+            cumulative = 0
+            for bound, n in zip(histogram.buckets, counts):
+                cumulative += n
+                lines.append(f'moodflix_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'moodflix_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'moodflix_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'moodflix_stage_seconds_count{{stage="{stage}"}} {count}')
+
+        with self._lock:
+            counters = sorted(self.counters.items())
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        for name, (help_text, fn, label) in list(self.gauges.items()):
+            try:
+                value = fn()
+            except Exception as e:
+                print(f"Gauge {name} failed: {e}")
+                continue
+            if value is None:
+                continue
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            if label is None:
+                lines.append(f"{name} {value}")
+                continue
+            for label_value, sample in sorted(value.items()):
+                lines.append(f'{name}{{{label}="{label_value}"}} {sample}')
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def begin_request():
+    """Starts collecting per-stage totals for the calling request.
+    Returns the RequestTimings"""
+    timings = RequestTimings()
+    _request_timings.set(timings)
+    return timings
+
+
+def end_request():
+    _request_timings.set(None)
+
+
+def record(stage, seconds):
+    registry.observe(stage, seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def propagate(fn):
+    """Wraps fn so its timings count towards the current request when it
+    runs on a pool thread"""
+    timings = _request_timings.get()
+    if timings is None:
+        return fn
+
+    def run(*args, **kwargs):
+        token = _request_timings.set(timings)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _request_timings.reset(token)
+    return run
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""MFNP v2 binary framing.
+
+v1 messages are plain JSON with frames and audio as base64 strings. v2
+carries the same JSON envelope plus raw binary attachments, so JPEG
+frames and audio travel without the base64 overhead:
+
+    b"MFNP"  magic                       4 bytes
+    version  (2)                         u8
+    reserved                             3 bytes
+    envelope length                      u32 little-endian
+    envelope                             UTF-8 JSON
+    attachment count                     u32 little-endian
+    per attachment: length u32 LE, then the raw bytes
+
+Inside the envelope's payload an attachment is referenced as
+{"$attachment": index}. decode_v2 replaces those references with
+memoryviews into the received buffer, so attachments are never copied.
+v2 requests are sent with Content-Type: application/x-mfnp.
+"""
+import json
+import struct
+
+MAGIC = b"MFNP"
+VERSION = 2
+CONTENT_TYPE = "application/x-mfnp"
+_HEADER = struct.Struct("<4sB3xI")
+_U32 = struct.Struct("<I")
+
+
+class MFNPDecodeError(ValueError):
+    pass
+
+
+def _resolve(node, attachments):
+    if isinstance(node, dict):
+        if len(node) == 1 and "$attachment" in node:
+            index = node["$attachment"]
+            if not isinstance(index, int) or not 0 <= index < len(attachments):
+                raise MFNPDecodeError(f"attachment {index!r} does not exist")
+            return attachments[index]
+        return {k: _resolve(v, attachments) for k, v in node.items()}
+    if isinstance(node, list):
+        return [_resolve(v, attachments) for v in node]
+    return node
+
+
+def decode_v2(buffer):
+    """Parses a v2 message. Returns the envelope dict with attachment
+    references replaced by memoryviews into buffer"""
+    view = memoryview(buffer)
+    if len(view) < _HEADER.size:
+        raise MFNPDecodeError("message too short")
+    magic, version, envelope_len = _HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise MFNPDecodeError("bad magic")
+    if version != VERSION:
+        raise MFNPDecodeError(f"unsupported binary version {version}")
+
+    pos = _HEADER.size
+    if pos + envelope_len + _U32.size > len(view):
+        raise MFNPDecodeError("truncated envelope")
+    envelope = json.loads(bytes(view[pos:pos + envelope_len]).decode("utf-8"))
+    pos += envelope_len
+
+    count = _U32.unpack_from(view, pos)[0]
+    pos += _U32.size
+    attachments = []
+    for _ in range(count):
+        if pos + _U32.size > len(view):
+            raise MFNPDecodeError("truncated attachment header")
+        length = _U32.unpack_from(view, pos)[0]
+        pos += _U32.size
+        if pos + length > len(view):
+            raise MFNPDecodeError("truncated attachment")
+        attachments.append(view[pos:pos + length])
+        pos += length
+
+    if not isinstance(envelope, dict):
+        raise MFNPDecodeError("envelope is not an object")
+    if "payload" in envelope:
+        envelope["payload"] = _resolve(envelope["payload"], attachments)
+    return envelope
+
+
+def encode_v2(message_type, payload, sender="client", session=None):
+    """Builds a v2 message. Any bytes/bytearray/memoryview found in payload
+    becomes an attachment. session: optional client session id for the
+    envelope"""
+    attachments = []
+
+    def extract(node):
+        if isinstance(node, (bytes, bytearray, memoryview)):
+            attachments.append(node)
+            return {"$attachment": len(attachments) - 1}
+        if isinstance(node, dict):
+            return {k: extract(v) for k, v in node.items()}
+        if isinstance(node, (list, tuple)):
+            return [extract(v) for v in node]
+        return node
+
+    envelope = {
+        "protocol": "MFNP",
+        "version": float(VERSION),
+        "sender": sender,
+        "message_type": message_type,
+        "payload": extract(payload),
+    }
+    if session is not None:
+        envelope["session"] = session
+    envelope = json.dumps(envelope).encode("utf-8")
+
+    parts = [_HEADER.pack(MAGIC, VERSION, len(envelope)), envelope, _U32.pack(len(attachments))]
+    for attachment in attachments:
+        parts.append(_U32.pack(len(attachment)))
+        parts.append(attachment)
+    return b"".join(parts)
+
+
+def parse_body(body, content_type=""):
+    """Parses a request body as v2 when the content type says so,
+    otherwise as v1 JSON"""
+    if content_type.split(";")[0].strip().lower() == CONTENT_TYPE:
+        return decode_v2(body)
+    return json.loads(body)
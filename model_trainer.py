@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""Background retraining of the RandomForest recommender.
+
+ModelTrainer watches the user log, retrains off the request path when new
+rows arrive (at most once per min_interval seconds, so a burst of log
+writes costs one retrain), and swaps the new (clf, encoders) tuple in atomically, so
+handlers always see either the old model or the new one, never a mix.
+Trained models are saved next to the log keyed by the log's content hash,
+so a restart with an unchanged log loads the model instead of refitting.
+"""
+import glob
+import hashlib
+import io
+import os
+import pickle
+import threading
+import time
+from datetime import datetime
+
+from aiengine import read_user_data, train_on_user_data
+
+# bump when the pickled layout or the feature set changes
+MODEL_ARTIFACT_VERSION = 2
+
+
+def compute_file_hash(path):
+    if not os.path.exists(path):
+        return None
+
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def sklearn_version():
+    # scikit-learn takes over a second to import; only pay for it when a
+    # model is actually loaded or saved
+    import sklearn
+    return sklearn.__version__
+
+
+def artifact_path(artifact_dir, csv_hash):
+    return os.path.join(artifact_dir, f"rf-{csv_hash[:16]}.pkl")
+
+
+def load_artifact(artifact_dir, csv_hash):
+    """Returns (clf_tuple, status) saved for this log hash, or None"""
+    path = artifact_path(artifact_dir, csv_hash)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            artifact = pickle.load(f)
+    except Exception as e:
+        print(f"Ignoring unreadable model artifact {path}: {e}")
+        return None
+    if (artifact.get("format") != MODEL_ARTIFACT_VERSION
+            or artifact.get("sklearn") != sklearn_version()
+            or artifact.get("csv_hash") != csv_hash):
+        return None
+    return artifact["clf_tuple"], artifact["status"]
+
+
+def save_artifact(artifact_dir, csv_hash, clf_tuple, status):
+    """Writes the artifact atomically and removes the ones for older logs"""
+    os.makedirs(artifact_dir, exist_ok=True)
+    path = artifact_path(artifact_dir, csv_hash)
+    tmp_path = path + ".tmp"
+    artifact = {
+        "format": MODEL_ARTIFACT_VERSION,
+        "sklearn": sklearn_version(),
+        "csv_hash": csv_hash,
+        "clf_tuple": clf_tuple,
+        "status": status,
+    }
+    with open(tmp_path, "wb") as f:
+        pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    for old in glob.glob(os.path.join(artifact_dir, "rf-*.pkl")):
+        if old != path:
+            os.remove(old)
+
+
+class ModelTrainer:
+
+    def __init__(self, csv_file, lock=None, poll_interval=10.0, artifact_dir=None, min_interval=0.0,
+                 clock=time.monotonic):
+        """lock: held while the log is read, so a half-written row is
+        never trained on
+        artifact_dir: where trained models are persisted, None disables it
+        min_interval: least seconds between two background retrains; log
+        changes in between are picked up together by the next one
+        clock: the monotonic time source min_interval is measured with"""
+        self.csv_file = csv_file
+        self.artifact_dir = artifact_dir
+        self.lock = lock or threading.Lock()
+        self.poll_interval = poll_interval
+        self.min_interval = min_interval
+        self.clock = clock
+        self._last_refresh = None
+        # (clf_tuple, status) is replaced as a whole on every swap
+        self._published = ((None, None), {"version": 0, "trained_at": None, "train_seconds": None, "rows": 0})
+        self._signature = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def current(self):
+        """The (clf, encoders) tuple to use for a request"""
+        return self._published[0]
+
+    def status(self):
+        return dict(self._published[1])
+
+    def snapshot(self):
+        """(clf_tuple, status) of the same model version"""
+        clf_tuple, status = self._published
+        return clf_tuple, dict(status)
+
+    def _log_signature(self):
+        try:
+            st = os.stat(self.csv_file)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def refresh(self, force=False):
+        """Retrains when the log changed since the last run.
+        Returns True when a new model was swapped in"""
+        signature = self._log_signature()
+        if signature == self._signature and not force:
+            return False
+        self._last_refresh = self.clock()
+
+        with self.lock:
+            signature = self._log_signature()
+            data = None
+            if signature is not None:
+                with open(self.csv_file, "rb") as f:
+                    data = f.read()
+        csv_hash = hashlib.sha256(data).hexdigest() if data is not None else None
+
+        if self.artifact_dir and csv_hash:
+            loaded = load_artifact(self.artifact_dir, csv_hash)
+            if loaded is not None:
+                clf_tuple, status = loaded
+                status = dict(status, version=max(status["version"], self._published[1]["version"] + 1))
+                self._published = (clf_tuple, status)
+                self._signature = signature
+                print(f"Model v{status['version']} loaded from artifact for log {csv_hash[:16]}")
+                return True
+
+        start = time.monotonic()
+        try:
+            df = read_user_data(io.BytesIO(data)) if data else None
+            clf_tuple = train_on_user_data(df, previous=self.current())
+        except Exception as e:
+            # keep serving the previous model; retry when the log changes again
+            print(f"Retraining failed, keeping model v{self.status()['version']}: {e}")
+            self._signature = signature
+            return False
+
+        status = {
+            "version": self._published[1]["version"] + 1,
+            "trained_at": datetime.now().isoformat(timespec="seconds"),
+            "train_seconds": round(time.monotonic() - start, 3),
+            "rows": 0 if df is None else len(df),
+        }
+        self._published = (clf_tuple, status)
+        self._signature = signature
+        print(f"Model v{status['version']} trained on {status['rows']} rows in {status['train_seconds']}s")
+
+        if self.artifact_dir and csv_hash and clf_tuple[0] is not None:
+            try:
+                save_artifact(self.artifact_dir, csv_hash, clf_tuple, status)
+            except OSError as e:
+                print(f"Cannot persist model artifact: {e}")
+        return True
+
+    def notify(self):
+        """Called after the log was written to, to retrain without waiting
+        for the next poll (but not sooner than min_interval after the last
+        retrain)"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_interval)
+            if self._stop.is_set():
+                break
+            if self._last_refresh is not None:
+                # notifications arriving meanwhile are folded into this run
+                wait = self._last_refresh + self.min_interval - self.clock()
+                if wait > 0 and self._stop.wait(wait):
+                    break
+            self._wake.clear()
+            self.refresh()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="model-trainer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
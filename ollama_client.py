@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Client for a local Ollama-compatible HTTP endpoint.
+
+Replies are streamed and parsed as they arrive, and every generation is
+bounded by a hard timeout. Connections are not reused: each generation
+opens its own and closes it when it returns. Closing is what makes Ollama
+stop generating once stop_when is satisfied or the deadline passes, and
+MoodFlix stops every reply after five titles, so a kept-alive connection
+could only be reused after letting the model run to the end. A new
+connection to the local server costs far less than that.
+"""
+import http.client
+import json
+import socket
+import time
+from collections import namedtuple
+from urllib.parse import urlparse
+
+# text: everything generated so far, complete: False when the reply was
+# cut short by the timeout/deadline or a connection error
+LLMReply = namedtuple("LLMReply", ["text", "complete"])
+
+
+def normalize_base_url(url):
+    """Accepts the forms OLLAMA_HOST is usually given in
+    ("127.0.0.1:11434", "http://host:port") and returns (host, port)"""
+    if "://" not in url:
+        url = "http://" + url
+    parsed = urlparse(url)
+    return parsed.hostname or "127.0.0.1", parsed.port or 11434
+
+
+class OllamaClient:
+
+    def __init__(self, base_url="http://127.0.0.1:11434", model="tinyllama",
+                 keep_alive="30m", timeout=30.0):
+        """keep_alive: how long Ollama keeps the model loaded between
+        requests (Ollama's own setting, not an HTTP keep-alive)"""
+        self.host, self.port = normalize_base_url(base_url)
+        self.model = model
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+
+    def _remaining(self, end):
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            raise socket.timeout("deadline passed before the reply started")
+        return min(self.timeout, remaining)
+
+    def generate(self, prompt, stop_when=None, deadline=None):
+        """Streams a completion for prompt.
+
+        stop_when: optional callable(text) -> bool, checked after every
+        streamed chunk; generation stops as soon as it returns True.
+        deadline: optional time.monotonic() value; the hard timeout is
+        whichever comes first of it and self.timeout.
+        Returns: LLMReply(text, complete)
+        """
+        end = time.monotonic() + self.timeout
+        if deadline is not None:
+            end = min(end, deadline)
+        body = json.dumps({
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True,
+            "keep_alive": self.keep_alive,
+        })
+
+        pieces = []
+        conn = None
+        try:
+            # connecting, sending and waiting for the headers all end at `end`
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self._remaining(end))
+            conn.request("POST", "/api/generate", body=body,
+                         headers={"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            if resp.status != 200:
+                print(f"Error calling Ollama: HTTP {resp.status} {resp.read()[:200]!r}")
+                return LLMReply("", False)
+
+            while True:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    print("Ollama timed out, returning partial reply")
+                    return LLMReply("".join(pieces), False)
+                conn.sock.settimeout(remaining)
+                line = resp.readline()
+                if not line:
+                    return LLMReply("".join(pieces), False)
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    print("Error calling Ollama:", chunk["error"])
+                    return LLMReply("".join(pieces), False)
+                pieces.append(chunk.get("response", ""))
+                if chunk.get("done"):
+                    return LLMReply("".join(pieces), True)
+                if stop_when is not None and stop_when("".join(pieces)):
+                    # closing the connection cancels the rest of the
+                    # generation on the server
+                    return LLMReply("".join(pieces), True)
+        except socket.timeout:
+            print("Ollama timed out, returning partial reply")
+            return LLMReply("".join(pieces), False)
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            print("Error calling Ollama:", e)
+            return LLMReply("".join(pieces), False)
+        finally:
+            if conn is not None:
+                conn.close()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Minimal stand-in for a local Ollama server.
+
+Answers POST /api/generate with a canned numbered list of movies, streamed
+word by word as NDJSON like the real server does, so the LLM path of
+MoodFlix can be exercised without a model:
+
+    python3 ollama_stub.py --port 11434 --delay 0.02
+    OLLAMA_HOST=http://127.0.0.1:11434 python3 server.py
+"""
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_REPLY = """Here are 5 movies you might enjoy right now:
+1. Minari (2020)
+2. Memories of Murder (2003)
+3. A Taxi Driver (2017)
+4. Mother (2009)
+5. Paddington 2 (2017)
+6. The Host (2006)
+Enjoy your movie night!"""
+
+
+class OllamaStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+    reply = CANNED_REPLY
+
+    def log_message(self, format, *args):
+        pass
+
+    def _write_chunk(self, obj):
+        data = (json.dumps(obj) + "\n").encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self.send_error(404)
+            return
+        content_len = int(self.headers.get("Content-Length", 0))
+        request_obj = json.loads(self.rfile.read(content_len) or b"{}")
+        model = request_obj.get("model", "stub")
+
+        if not request_obj.get("stream", True):
+            body = json.dumps({"model": model, "response": self.reply, "done": True}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for token in self.reply.split(" "):
+                time.sleep(self.delay)
+                self._write_chunk({"model": model, "response": token + " ", "done": False})
+            self._write_chunk({"model": model, "response": "", "done": True})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # the client stops reading once it has enough titles
+            self.close_connection = True
+
+
+def run_stub(host="127.0.0.1", port=11434, delay=0.0):
+    OllamaStubHandler.delay = delay
+    server = ThreadingHTTPServer((host, port), OllamaStubHandler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds between streamed tokens")
+    args = parser.parse_args()
+
+    server = run_stub(args.host, args.port, args.delay)
+    print(f"Ollama stub running on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
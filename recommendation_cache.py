@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""Context-keyed cache for LLM movie recommendations.
+
+Contexts that differ only by a few tenths of a degree or a slightly
+different weather description map to the same key, so repeated
+/inference calls within the TTL skip the LLM entirely.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+TEMPERATURE_BUCKET = 5.0  # degrees C
+COORDINATE_DECIMALS = 1  # about 11 km
+
+# coarse weather classes, checked in order against the description
+WEATHER_CLASSES = [
+    ("storm", ("thunder", "storm", "squall", "tornado")),
+    ("snow", ("snow", "sleet")),
+    ("rain", ("rain", "drizzle", "shower")),
+    ("fog", ("mist", "fog", "haze", "smoke", "dust", "sand", "ash")),
+    ("clouds", ("cloud", "overcast")),
+    ("clear", ("clear", "sun")),
+]
+
+
+def weather_class(description):
+    description = str(description).lower()
+    for name, keywords in WEATHER_CLASSES:
+        if any(k in description for k in keywords):
+            return name
+    return "other"
+
+
+def _bucket(value, size):
+    try:
+        return int(float(value) // size)
+    except (TypeError, ValueError):
+        return None
+
+
+def _rounded(value):
+    try:
+        return round(float(value), COORDINATE_DECIMALS)
+    except (TypeError, ValueError):
+        return None
+
+
+def context_key(environment, mood, tone):
+    """Normalised cache key for an /inference environment plus the
+    analysed mood and voice tone"""
+    return json.dumps([
+        str(environment.get("city", "")).strip().lower(),
+        _rounded(environment.get("lat")),
+        _rounded(environment.get("lon")),
+        str(environment.get("today_status", "")).strip().lower(),
+        str(environment.get("tomorrow_status", "")).strip().lower(),
+        str(environment.get("weekday", "")).strip().lower(),
+        weather_class(environment.get("weather_desc", "")),
+        _bucket(environment.get("temperature"), TEMPERATURE_BUCKET),
+        mood,
+        tone,
+    ])
+
+
+def _valid_entry(entry):
+    return (isinstance(entry, list) and len(entry) == 3
+            and isinstance(entry[0], str)
+            and isinstance(entry[1], (int, float)) and not isinstance(entry[1], bool)
+            and isinstance(entry[2], list) and all(isinstance(title, str) for title in entry[2]))
+
+
+class RecommendationCache:
+    """Size-bounded LRU with per-entry TTL. Optionally persisted to a JSON
+    file so entries survive server restarts. The file is rewritten off the
+    request path, at most once per save_interval seconds."""
+
+    def __init__(self, max_size=256, ttl=1800.0, path=None, save_interval=5.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = None
+        self.save_interval = save_interval
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        # serialises writes of the file; a save is pending while _timer is set
+        self._save_lock = threading.Lock()
+        self._timer = None
+        if path:
+            self.attach(path)
+
+    def attach(self, path):
+        """Loads unexpired entries from path and persists to it from now on.
+        An unreadable file is ignored and malformed entries are skipped, so
+        a damaged cache never keeps the server from starting"""
+        self.path = path
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, mode="r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable recommendation cache {path}: {e}")
+            return
+        if not isinstance(stored, list):
+            print(f"Ignoring recommendation cache {path}: not a list of entries")
+            return
+        valid = [entry for entry in stored if _valid_entry(entry)]
+        if len(valid) < len(stored):
+            print(f"Skipping {len(stored) - len(valid)} malformed entries of recommendation cache {path}")
+        now = time.time()
+        with self._lock:
+            for key, expires_at, value in valid:
+                if expires_at > now:
+                    self._entries[key] = (expires_at, value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            if self.path and self._timer is None:
+                self._timer = threading.Timer(self.save_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Writes a pending save now; called by the timer and on shutdown"""
+        with self._save_lock:
+            with self._lock:
+                timer, self._timer = self._timer, None
+                if timer is None or not self.path:
+                    return
+                path = self.path
+                snapshot = [[k, exp, v] for k, (exp, v) in self._entries.items()]
+            if timer is not threading.current_thread():
+                timer.cancel()
+            tmp_path = path + ".tmp"
+            try:
+                with open(tmp_path, mode="w", encoding="utf-8") as f:
+                    json.dump(snapshot, f)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Cannot persist recommendation cache: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -1,74 +1,270 @@
 #!/usr/bin/env python3
-from http.server import BaseHTTPRequestHandler, HTTPServer
+import time
+_import_started = time.perf_counter()
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import json
 import os
-import time
-import socket
+import signal
+import threading
 import csv
+import io
+import tempfile
+import numpy as np
+from array import array
+from contextlib import contextmanager
 from urllib.parse import urlparse, parse_qs
-from aiengine import train_on_user_data, ollama_inference, combined_recommendations, emotion_history_with_confidence
+from concurrent.futures import ThreadPoolExecutor
+from aiengine import ollama_inference, classifier_ranking, merge_recommendations, RequestAnalysis, InferenceStreamRegistry, EmotionSessionRegistry, llm_cache, warm_up, audio_decode_report
+from model_trainer import ModelTrainer
+from mfnp import parse_body
+import metrics
+import inference_pool
+from logstore import LogStore, GroupCommitWriter, LOG_FIELDS, LOG_HEADER, row_to_log, row_digest, csv_row, parse_timestamp
 
 HOST = "0.0.0.0" 
 PORT = 8000
-IDLE_TIMEOUT = 60
+IDLE_TIMEOUT = 60  # seconds without requests before exiting, 0 disables
+# /inference requests analysed at the same time, and how many more may wait
+INFERENCE_WORKERS = int(os.environ.get("MOODFLIX_INFERENCE_WORKERS", "2"))
+INFERENCE_QUEUE_SIZE = int(os.environ.get("MOODFLIX_INFERENCE_QUEUE", "4"))
+# stream-frame pushes scored at the same time, and how many more may wait;
+# a separate gate, so frame scoring never holds a slot an LLM call needs
+STREAM_FRAME_WORKERS = int(os.environ.get("MOODFLIX_STREAM_FRAME_WORKERS", "2"))
+STREAM_FRAME_QUEUE_SIZE = int(os.environ.get("MOODFLIX_STREAM_FRAME_QUEUE", "4"))
+# seconds an /inference request may wait for the LLM before answering with
+# the classifier ranking and whatever titles the LLM produced so far; the
+# budget starts once the request's mood and voice tone are known
+INFERENCE_DEADLINE = float(os.environ.get("MOODFLIX_INFERENCE_DEADLINE", "10"))
 CSV_FILE = "tmp/user_logs.csv"
+LLM_CACHE_FILE = "tmp/llm_cache.json"
+# trained models keyed by the content hash of CSV_FILE
+MODEL_DIR = "tmp/models"
+# seconds between checks of CSV_FILE for new rows to retrain on
+RETRAIN_INTERVAL = 10
+# least seconds between two retrains, however often the log is written to
+RETRAIN_MIN_INTERVAL = float(os.environ.get("MOODFLIX_RETRAIN_MIN_INTERVAL", "30"))
+# after the socket is bound, load the emotion model and run one dummy
+# inference in the background; "0" leaves that to the first /inference
+WARM_UP = os.environ.get("MOODFLIX_WARM_UP", "1") != "0"
+
+# /inference/log rows are committed in batches of up to LOG_BATCH_SIZE, or
+# after LOG_FLUSH_INTERVAL seconds; LOG_FSYNC is "always", "interval" or "never"
+LOG_BATCH_SIZE = 64
+LOG_FLUSH_INTERVAL = 0.002
+LOG_FSYNC = os.environ.get("MOODFLIX_LOG_FSYNC", "interval")
+
+# serialises every write to CSV_FILE across handler threads
+csv_lock = threading.RLock()
+# The objects below own files and threads and are built by setup(), not at
+# import: inference_pool's spawned workers re-import this module (as
+# __mp_main__) and must not get a log store, writer, trainer or cache of
+# their own.
+# row-offset index over CSV_FILE for /inference/log reads and appends
+log_store = None
+# group-commit writer in front of log_store
+log_writer = None
+# run_server trains (or loads) the first model in the background, then
+# starts the periodic retraining
+model_trainer = None
+# runs the voice analysis and the RandomForest branch of each /inference
+# request while its handler thread scores the frames and waits on the LLM
+ranking_pool = None
+
+
+def setup():
+    """Builds the serving state: log store and writer, model trainer and
+    ranking pool, and reloads the LLM cache kept across idle-timeout
+    restarts. Called by run_server; does nothing when already done"""
+    global log_store, log_writer, model_trainer, ranking_pool
+    if log_store is not None:
+        return
+    log_store = LogStore(CSV_FILE, lock=csv_lock)
+    log_writer = GroupCommitWriter(log_store, batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_INTERVAL, fsync=LOG_FSYNC)
+    model_trainer = ModelTrainer(CSV_FILE, lock=csv_lock, poll_interval=RETRAIN_INTERVAL, artifact_dir=MODEL_DIR,
+                                 min_interval=RETRAIN_MIN_INTERVAL)
+    ranking_pool = ThreadPoolExecutor(max_workers=2 * INFERENCE_WORKERS, thread_name_prefix="ranking")
+    llm_cache.attach(LLM_CACHE_FILE)
+
+
+class StartupReport:
+    """Seconds spent in each startup phase, in the order they ran, and
+    whether the background warm-up has finished"""
+
+    def __init__(self):
+        self.phases = {}
+        self.ready = threading.Event()
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.phases[name] = round(seconds, 3)
+        print(f"Startup phase {name}: {seconds:.3f}s")
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def status(self):
+        with self._lock:
+            phases = dict(self.phases)
+        return {"ready": self.ready.is_set(), "phases": phases}
+
+
+startup = StartupReport()
+
+
+class InferenceGate:
+    """Bounds concurrent /inference work. At most `workers` requests run at
+    once, up to `queue_size` more wait for a slot, and anything beyond
+    that is rejected so the handler can answer 503 right away."""
+
+    def __init__(self, workers, queue_size):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.running = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def try_enter(self):
+        with self._cond:
+            if self.running + self.waiting >= self.workers + self.queue_size:
+                return False
+            self.waiting += 1
+            while self.running >= self.workers:
+                self._cond.wait()
+            self.waiting -= 1
+            self.running += 1
+            return True
+
+    def leave(self):
+        with self._cond:
+            self.running -= 1
+            self._cond.notify()
+
+
+inference_gate = InferenceGate(INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE)
+stream_frame_gate = InferenceGate(STREAM_FRAME_WORKERS, STREAM_FRAME_QUEUE_SIZE)
+# open /inference/stream sessions; dropped after STREAM_IDLE_TIMEOUT seconds without a push
+STREAM_IDLE_TIMEOUT = 120
+stream_registry = InferenceStreamRegistry(STREAM_IDLE_TIMEOUT)
+# face results per client "session" id from the MFNP envelope, so a
+# returning client's earlier frames still count (decayed) towards its mood;
+# dropped after EMOTION_SESSION_TIMEOUT seconds without a request
+EMOTION_SESSION_TIMEOUT = 1800
+EMOTION_SESSIONS_MAX = 1024
+emotion_sessions = EmotionSessionRegistry(EMOTION_SESSION_TIMEOUT, EMOTION_SESSIONS_MAX)
+
+# request counters are labelled with these paths, anything else is "other"
+KNOWN_PATHS = {"/inference", "/inference/stream", "/inference/log", "/inference/log/export",
+               "/inference/log/stats", "/sync", "/model", "/metrics", "/startup"}
+metrics.registry.gauge("moodflix_inference_running", lambda: inference_gate.running, "/inference requests being processed")
+metrics.registry.gauge("moodflix_inference_waiting", lambda: inference_gate.waiting, "/inference requests waiting for a slot")
+metrics.registry.gauge("moodflix_inference_streams", lambda: len(stream_registry), "open /inference/stream sessions")
+metrics.registry.gauge("moodflix_stream_frames_running", lambda: stream_frame_gate.running, "stream-frame pushes being scored")
+metrics.registry.gauge("moodflix_stream_frames_waiting", lambda: stream_frame_gate.waiting, "stream-frame pushes waiting for a slot")
+metrics.registry.gauge("moodflix_emotion_sessions", lambda: len(emotion_sessions), "client sessions with face history")
+metrics.registry.gauge("moodflix_log_queue_depth", lambda: log_writer.stats()["queue_depth"], "log rows waiting to be written")
+metrics.registry.gauge("moodflix_log_flush_ms_max", lambda: log_writer.stats()["max_flush_ms"], "slowest log batch write")
+metrics.registry.gauge("moodflix_llm_cache_hits", lambda: llm_cache.stats()["hits"], "LLM cache hits since start")
+metrics.registry.gauge("moodflix_llm_cache_misses", lambda: llm_cache.stats()["misses"], "LLM cache misses since start")
+metrics.registry.gauge("moodflix_audio_decodes", lambda: {fmt: r["count"] for fmt, r in audio_decode_report().items()},
+                       "audio clips decoded since start, per format", label="format")
+metrics.registry.gauge("moodflix_audio_decode_ms_avg", lambda: {fmt: r["avg_ms"] for fmt, r in audio_decode_report().items()},
+                       "average audio decode time, per format", label="format")
+metrics.registry.gauge("moodflix_model_version", lambda: model_trainer.status()["version"], "recommendation model version")
+metrics.registry.gauge("moodflix_ready", lambda: int(startup.ready.is_set()), "1 once the startup warm-up has finished")
+
+def is_header(row):
+    return bool(row) and row[0].strip() == LOG_HEADER[0]
+
+
+@contextmanager
+def atomic_csv_writer(path):
+    """csv.writer on a temp file next to path, renamed over path only when
+    the block completes, so a crash leaves either the old or the new log"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".merge-", suffix=".csv.tmp")
+    try:
+        with os.fdopen(fd, mode="w", newline="", encoding="utf-8") as f:
+            yield csv.writer(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
-clf_tuple = train_on_user_data(CSV_FILE)
-
-timestamp = ""
-temp = ""
-lat = ""
-lon = ""
-city = ""
-weather_desc = ""
-today_status = ""
-tomorrow_status = ""
-weekday = ""
-mood = ""
-tone = ""
-title = ""
-
-def compute_file_hash(path):
-    if not os.path.exists(path):
-        return None
-    
-    with open(path, "rb") as f:
-        data = f.read()
-
-    return hashlib.sha256(data).hexdigest()
 
 def merge_csv_data(local_path, incoming_rows):
-
-    merged_rows = []
-    seen = set()
-
-    # load the existing rows
+    """Merges incoming_rows (optionally led by a header) into the log at
+    local_path without duplicates. The existing log is streamed twice
+    and only 8-byte row digests are held in memory, whatever its size.
+    Returns (rows added, incoming rows skipped as duplicates)"""
+    # JSON rows may hold numbers or nulls; compare and store them as the
+    # strings csv.writer would write
+    incoming_rows = [csv_row(row) for row in incoming_rows if row]
+
+    # pass 1: digest every existing row
+    header = None
+    digests = array("Q")
     if os.path.exists(local_path):
-        with open(local_path, mode="r", encoding="utf-8") as f:
-            reader = list(csv.reader(f))
-            if reader:
-                existing_header = reader[0]
-                existing_data = reader[1:]
-
-    for row in existing_data:
-        key = tuple(row)
-        if key not in seen:
-            seen.add(key)
-            merged_rows.append(row)
-        
-    for row in incoming_rows[1:]:
-        key = tuple(row)
-        if key not in seen:
-            seen.add(key)
-            merged_rows.append(row)
-
-    # write back without duplication
-    with open(local_path, mode="w",encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(existing_header)
-        writer.writerows(merged_rows)
-
-    return len(merged_rows)
+        with open(local_path, mode="r", newline="", encoding="utf-8") as f:
+            for row in csv.reader(f):
+                if not row:
+                    continue
+                if header is None and not digests and is_header(row):
+                    header = row
+                    continue
+                digests.append(row_digest(row))
+
+    has_header = header is not None
+    existing = np.frombuffer(digests, dtype=np.uint64)
+    # the first copy of each existing row is kept
+    keep = np.zeros(len(existing), dtype=bool)
+    keep[np.unique(existing, return_index=True)[1]] = True
+    known = np.sort(existing)
+
+    if incoming_rows and is_header(incoming_rows[0]):
+        header = header or incoming_rows[0]
+        incoming_rows = incoming_rows[1:]
+
+    added = skipped = 0
+    with atomic_csv_writer(local_path) as writer:
+        # training reads the log with pandas, which needs the header
+        writer.writerow(header or LOG_HEADER)
+
+        # pass 2: copy the existing rows
+        if len(existing):
+            with open(local_path, mode="r", newline="", encoding="utf-8") as f:
+                i = 0
+                for row in csv.reader(f):
+                    if not row:
+                        continue
+                    if has_header:
+                        has_header = False
+                        continue
+                    if keep[i]:
+                        writer.writerow(row)
+                    i += 1
+
+        new = set()
+        for row in incoming_rows:
+            if not row:
+                continue
+            digest = row_digest(row)
+            pos = np.searchsorted(known, np.uint64(digest))
+            if (pos < len(known) and known[pos] == digest) or digest in new:
+                skipped += 1
+                continue
+            new.add(digest)
+            writer.writerow(row)
+            added += 1
+
+    return added, skipped
  
 
 def make_response(message_type, payload, sender="server", code=200):
@@ -84,12 +280,87 @@ def make_response(message_type, payload, sender="server", code=200):
 class JetsonHandler(BaseHTTPRequestHandler):
 
     def _send_json(self, code, obj):
+        path = urlparse(self.path).path
+        metrics.registry.inc("moodflix_requests_total", path=path if path in KNOWN_PATHS else "other", code=code)
         self.send_response(code)
         self.send_header("Content-type", "application/json")
         self.send_header("Access-Control-Allow-Origin", "*")
         self.end_headers()
         self.wfile.write(json.dumps(obj).encode())
 
+    def _read_body(self):
+        """Reads the request body into one preallocated buffer. MFNP v2
+        attachments are later sliced out of it without copying"""
+        content_len = int(self.headers.get("Content-Length", 0))
+        body = bytearray(content_len)
+        view = memoryview(body)
+        received = 0
+        while received < content_len:
+            n = self.rfile.readinto(view[received:])
+            if not n:
+                break
+            received += n
+        view.release()
+        if received < content_len:
+            del body[received:]
+        return body
+
+    def _run_inference(self, payload, analysis, timings=None):
+        """Runs the LLM and classifier branches for one analysed request.
+        analysis: a RequestAnalysis, or a function returning one, called
+        only once the request has a slot
+        timings: the request's metrics.RequestTimings, returned in the
+        response when the payload asks for "timings"
+        Returns (status, MFNP response)"""
+        if not inference_gate.try_enter():
+            return make_response("error", {"reason": "Server busy, retry later"}, code=503)
+        try:
+            if callable(analysis):
+                try:
+                    analysis = analysis()
+                except Exception as e:
+                    return make_response("error", {"reason": f"Analysis failed: {e}"}, code=500)
+            # the voice tone is computed on the pool while this thread
+            # scores the frames, and the classifier branch runs alongside
+            # the LLM; all share the analysis, so mood and tone are still
+            # computed only once
+            clf_tuple, model_status = model_trainer.snapshot()
+            voice = ranking_pool.submit(metrics.propagate(lambda: analysis.tone))
+            ranking = ranking_pool.submit(metrics.propagate(classifier_ranking), clf_tuple, payload, analysis)
+            try:
+                analysis.mood
+                voice.result()
+                # the LLM's budget starts after the analysis, so slow face
+                # scoring does not eat into it
+                deadline = time.monotonic() + INFERENCE_DEADLINE
+                primary_movies, mood, tone = ollama_inference(payload, analysis, deadline)
+            except Exception as e:
+                ranking.cancel()
+                return make_response("Ollama error", {"reason": str(e)}, code=500)
+
+            try:
+                ranked_movies = ranking.result()
+                with metrics.timed("merge"):
+                    final_movies = merge_recommendations(ranked_movies, primary_movies)
+            except Exception as e:
+                return make_response("Model combine error", {"reason": str(e)}, code=500)
+        finally:
+            inference_gate.leave()
+
+        response = {
+            "movies" : final_movies,
+            "primary_llm" : primary_movies,
+            "mood" : mood,
+            "tone" : tone,
+            # True when the LLM missed INFERENCE_DEADLINE
+            "degraded" : not analysis.llm_complete,
+            "model_version" : model_status["version"]
+        }
+        if timings is not None and payload.get("timings"):
+            # milliseconds per stage; per-frame stages are summed over frames
+            response["timings"] = timings.as_ms()
+        return make_response("inference", response, sender="server")
+
     def do_OPTIONS(self):
         self.send_response(200, "OK")
         self.send_header("Access-Control-Allow-Origin", "*")
@@ -106,61 +377,76 @@ class JetsonHandler(BaseHTTPRequestHandler):
             except ValueError:
                 limit = 50
 
-            logs = []
-            if os.path.exists(CSV_FILE):
-                with open(CSV_FILE, mode="r", encoding="utf-8") as f:
-                    reader = csv.reader(f)
-                    rows = list(reader)
-
-                    # 마지막 limit개만 사용
-                    rows = rows[-limit:]
-
-                    for row in rows:
-                        # CSV 컬럼 순서:
-                        # [0] timestamp
-                        # [1] city
-                        # [2] lat
-                        # [3] lon
-                        # [4] today_status
-                        # [5] tomorrow_status
-                        # [6] weekday
-                        # [7] weather_desc
-                        # [8] temp
-                        # [9] mood
-                        # [10] tone
-                        # [11] movie_title
-                        if len(row) < 12:
-                            continue
-                        logs.append({
-                            "clientSentAt": row[0],
-                            "city": row[1],
-                            "lat": row[2],
-                            "lon": row[3],
-                            "today_status": row[4],
-                            "tomorrow_status": row[5],
-                            "weekday": row[6],
-                            "weather_desc": row[7],
-                            "temperature": row[8],
-                            "mood": row[9],
-                            "tone": row[10],
-                            "movieTitle": row[11],
-                        })
+            bounds = {}
+            for key in ("since", "until"):
+                bounds[key] = parse_timestamp(qs[key][0]) if key in qs else None
+                if key in qs and bounds[key] is None:
+                    status, response = make_response("error", {"reason": f"Invalid {key} timestamp"}, code=400)
+                    return self._send_json(status, response)
+            since, until = bounds["since"], bounds["until"]
+            mood = qs.get("mood", [None])[0]
+            city = qs.get("city", [None])[0]
+
+            # rows with missing columns are skipped
+            rows = log_store.query(limit, since=since, until=until, mood=mood, city=city)
+            logs = [row_to_log(row) for row in rows if len(row) >= len(LOG_FIELDS)]
 
             status, response = make_response("inference-log", logs)
             return self._send_json(status, response)
+
+        if parsed.path == "/inference/log/export":
+            # the whole log as CSV with a header, as train_on_user_data reads
+            # it. Rows are streamed block by block as they are read, so the
+            # length is unknown up front and the connection closing marks
+            # the end of the body
+            self.close_connection = True
+            self.send_response(200)
+            self.send_header("Content-type", "text/csv; charset=utf-8")
+            self.send_header("Content-Disposition", "attachment; filename=user_logs.csv")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            out = io.TextIOWrapper(self.wfile, encoding="utf-8", newline="", write_through=False)
+            try:
+                log_store.export_csv(out)
+                out.flush()
+            finally:
+                # the handler still owns wfile
+                out.detach()
+            return
+
+        if parsed.path == "/inference/log/stats":
+            status, response = make_response("log-writer-status", log_writer.stats())
+            return self._send_json(status, response)
+
+        if parsed.path == "/metrics":
+            body = metrics.registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-type", "text/plain; version=0.0.4; charset=utf-8")
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        if parsed.path == "/model":
+            status, response = make_response("model-status", model_trainer.status())
+            return self._send_json(status, response)
+
+        if parsed.path == "/startup":
+            status, response = make_response("startup-status", startup.status())
+            return self._send_json(status, response)
         
         status, response = make_response("error", {"reason": "unknown endpoint"}, code=404)
         return self._send_json(status, response)
 
     def do_POST(self):
         if self.path == "/inference":
-            emotion_history_with_confidence.clear()  # clearing per request
-            content_len = int(self.headers.get("Content-Length", 0))
-            raw_body = self.rfile.read(content_len)
+            raw_body = self._read_body()
+            timings = metrics.begin_request()
             
             # step 1: validating JSON
             try:
-                request_obj = json.loads(raw_body.decode())
+                with metrics.timed("json_parse"):
+                    request_obj = parse_body(raw_body, self.headers.get("Content-Type", ""))
             except:
                 status, response = make_response("error", {"reason": "Invalid JSON"}, code=400)
                 return self._send_json(status, response)
@@ -179,38 +465,100 @@ class JetsonHandler(BaseHTTPRequestHandler):
                 status, response = make_response("error", {"reason": "Wrong message type for /inference"}, code=400)
                 return self._send_json(status, response)
             
+            session_id = request_obj.get("session")
+            if session_id is not None and (not isinstance(session_id, str) or not 0 < len(session_id) <= 128):
+                status, response = make_response("error", {"reason": "session must be a string of 1 to 128 characters"}, code=400)
+                return self._send_json(status, response)
+
             # data client intended to send
+            # frames and audio are decoded and analysed once per request
+            session = emotion_sessions.get(session_id) if session_id else None
+            analysis = RequestAnalysis(request_obj["payload"], session=session)
             try:
-                primary_movies, mood, tone = ollama_inference(request_obj["payload"])
-            except Exception as e:
-                status, response = make_response("Ollama error", {"reason": e}, code=500)
-                return self._send_json(status, response)
+                status, response = self._run_inference(request_obj["payload"], analysis, timings)
+            finally:
+                metrics.end_request()
+            return self._send_json(status, response)
+   
+        if self.path == "/inference/stream":
+            raw_body = self._read_body()
 
+            # step 1: validating JSON
             try:
-                final_movies = combined_recommendations(primary_movies, clf_tuple, request_obj["payload"])
-            except Exception as e:
-                status, response = make_response("Model combine error", {"reason": e}, code=500)
+                request_obj = parse_body(raw_body, self.headers.get("Content-Type", ""))
+            except:
+                status, response = make_response("error", {"reason": "Invalid JSON"}, code=400)
+                return self._send_json(status, response)
+
+            # step 2: validate MFNP format
+            required_keys = ["protocol", "version", "sender", "message_type", "payload"]
+            if not all(k in request_obj for k in required_keys):
+                status, response = make_response("error", {"reason": "Invalid MNFP message format"}, code=400)
+                return self._send_json(status, response)
+
+            if request_obj["protocol"] != "MFNP":
+                status, response = make_response("error", {"reason": "Unsupported protocol"}, code=400)
                 return self._send_json(status, response)
 
-            status, response = make_response(
-                "inference",
-                {
-                    "movies" : final_movies,
-                    "primary_llm" : primary_movies,
-                    "mood" : mood,
-                    "tone" : tone
-                },
-                sender="server"
-            )
+            message_type = request_obj["message_type"]
+            if message_type not in ["stream-open", "stream-frame", "stream-audio", "stream-done"]:
+                status, response = make_response("error", {"reason": "Wrong message type for /inference/stream"}, code=400)
+                return self._send_json(status, response)
+
+            payload = request_obj["payload"]
+            if message_type == "stream-open":
+                stream_id = stream_registry.open()
+                status, response = make_response("stream-open", {"stream_id": stream_id})
+                return self._send_json(status, response)
+
+            stream = stream_registry.get(payload.get("stream_id"))
+            if stream is None:
+                status, response = make_response("error", {"reason": "Unknown or expired stream_id"}, code=404)
+                return self._send_json(status, response)
+
+            if message_type == "stream-frame":
+                if not stream_frame_gate.try_enter():
+                    status, response = make_response("error", {"reason": "Server busy, retry later"}, code=503)
+                    return self._send_json(status, response)
+                try:
+                    stream.add_frames(payload.get("images", []))
+                except Exception as e:
+                    status, response = make_response("error", {"reason": f"Frame analysis failed: {e}"}, code=500)
+                    return self._send_json(status, response)
+                finally:
+                    stream_frame_gate.leave()
+                status, response = make_response("stream-frame", {"mood": stream.mood, "frames": stream.frames_seen})
+                return self._send_json(status, response)
+
+            if message_type == "stream-audio":
+                try:
+                    stream.add_audio(payload.get("audio", ""))
+                except ValueError as e:
+                    status, response = make_response("error", {"reason": str(e)}, code=400)
+                    return self._send_json(status, response)
+                status, response = make_response("stream-audio", {"bytes": stream.audio_bytes})
+                return self._send_json(status, response)
+
+            # stream-done: the mood is already tallied, only the LLM is left.
+            # The stream is closed once the request has a slot, so a client
+            # answered 503 can send stream-done again
+            def admitted():
+                stream_registry.close(payload["stream_id"])
+                return stream.analysis(payload)
+
+            timings = metrics.begin_request()
+            try:
+                status, response = self._run_inference(payload, admitted, timings)
+            finally:
+                metrics.end_request()
             return self._send_json(status, response)
-   
+
         if self.path == "/inference/log":
-            content_len = int(self.headers.get("Content-Length", 0))
-            raw_body = self.rfile.read(content_len)
+            raw_body = self._read_body()
 
             # validate json
             try:
-                request_obj = json.loads(raw_body.decode())
+                request_obj = parse_body(raw_body, self.headers.get("Content-Type", ""))
             except:
                 status, response = make_response("error", {"reason": "Invalid JSON"}, code=400)
                 return self._send_json(status, response)
@@ -235,7 +583,6 @@ class JetsonHandler(BaseHTTPRequestHandler):
 
             # data client intended to send
             try:
-                global timestamp, temp, lat, lon, city, weather_desc, today_status, tomorrow_status, weekday, title
                 timestamp = request_obj["payload"].get("clientSentAt", "")
                 env = request_obj["payload"].get("env") or {}
                 temp = env.get("temperature", "")
@@ -254,9 +601,8 @@ class JetsonHandler(BaseHTTPRequestHandler):
                 row = [timestamp,city,lat,lon,today_status,tomorrow_status,weekday,weather_desc,temp,mood,tone,title]
 
 		        # WRITE IMMEDIATELY
-                with open(CSV_FILE, mode="a", newline="", encoding="utf-8") as f:
-                    writer = csv.writer(f)
-                    writer.writerow(row)
+                log_writer.write(row)
+                model_trainer.notify()
             except PermissionError as e:
                 status, response = make_response("error", {"reason": "Permission Error: Cannot write to csv"}, code=500)
                 return self._send_json(status, response)
@@ -268,12 +614,11 @@ class JetsonHandler(BaseHTTPRequestHandler):
             return self._send_json(status, response)
         
         if self.path == "/sync":
-            content_len = int(self.headers.get("Content-Length", 0))
-            raw_body = self.rfile.read(content_len)
+            raw_body = self._read_body()
             
             # step 1: validating JSON
             try:
-                request_obj = json.loads(raw_body.decode())
+                request_obj = parse_body(raw_body, self.headers.get("Content-Type", ""))
             except:
                 status, response = make_response("error", {"reason": "Invalid JSON"}, code=400)
                 return self._send_json(status, response)
@@ -288,21 +633,75 @@ class JetsonHandler(BaseHTTPRequestHandler):
                 status, response = make_response("error", {"reason": "Unsupported protocol"}, code=400)
                 return self._send_json(status, response)
 
-            if request_obj["message_type"] not in ["sync-request", "sync-merge"]:
+            if request_obj["message_type"] not in ["sync-request", "sync-merge", "sync-summary", "sync-delta"]:
                 status, response = make_response("error", {"reason": "Wrong message type for /sync"}, code=400)
                 return self._send_json(status, response)
 
+            # delta mode: the peer sends its per-day bucket summary, the
+            # server answers with its row digests for the days that differ,
+            # then only the missing rows travel in each direction
+            if request_obj["message_type"] == "sync-summary":
+                buckets = request_obj["payload"].get("buckets") or {}
+                server_buckets = log_store.summary()
+                days = [day for day in set(buckets) | set(server_buckets) if buckets.get(day) != server_buckets.get(day)]
+                status, response = make_response(
+                    "sync-summary",
+                    {"days": log_store.day_digests(days), "watermark": log_store.watermark()},
+                    sender="server"
+                )
+                return self._send_json(status, response)
+
+            if request_obj["message_type"] == "sync-delta":
+                payload = request_obj["payload"]
+                incoming_rows = payload.get("rows", [])
+                try:
+                    # rows appended by others since the peer's last sync
+                    newer = log_store.rows_since(payload.get("watermark"))
+                    added, skipped = log_store.append_missing(incoming_rows)
+                    outgoing = log_store.rows_for_digests(payload.get("want", []))
+                except Exception as e:
+                    status, response = make_response("error", {"reason": f"Delta sync failed: {e}"}, code=500)
+                    return self._send_json(status, response)
+                if added:
+                    model_trainer.notify()
+
+                if newer is not None:
+                    sent = set(row_digest(row) for row in incoming_rows + outgoing)
+                    outgoing += [row for row in newer if row_digest(row) not in sent]
+                status, response = make_response(
+                    "sync-delta",
+                    {
+                        "rows" : outgoing,
+                        "added" : added,
+                        "skipped" : skipped,
+                        # the peer's watermark predates a rewrite or restart;
+                        # it should run a sync-summary round
+                        "stale_watermark" : "watermark" in payload and newer is None,
+                        "watermark" : log_store.watermark(),
+                    },
+                    sender="server"
+                )
+                return self._send_json(status, response)
+
             if request_obj["message_type"] == "sync-request":
                 incoming_rows = request_obj["payload"].get("rows", [])
-                merge_csv_data(CSV_FILE, incoming_rows)
-
-                final_rows = []
-                with open(CSV_FILE, mode="r", encoding="utf-8") as f:
-                    final_rows = list(csv.reader(f))
+                try:
+                    with csv_lock:
+                        added, skipped = merge_csv_data(CSV_FILE, incoming_rows)
+
+                        final_rows = []
+                        with open(CSV_FILE, mode="r", encoding="utf-8") as f:
+                            final_rows = list(csv.reader(f))
+                    log_store.invalidate()
+                    model_trainer.notify()
+                except Exception as e:
+                    log_store.invalidate()
+                    status, response = make_response("error", {"reason": f"Write failed: {e}"}, code=500)
+                    return self._send_json(status, response)
 
                 status, response = make_response(
                     "sync-merge",
-                    {"rows" : final_rows},
+                    {"rows" : final_rows, "added" : added, "skipped" : skipped},
                     sender="server"
                 ) 
                 return self._send_json(status, response)
@@ -311,10 +710,11 @@ class JetsonHandler(BaseHTTPRequestHandler):
                 incoming_rows = request_obj["payload"].get("rows", [])
                 
                 try:
-                    with open(CSV_FILE, mode="w", newline="", encoding="utf-8") as f:
-                        writer = csv.writer(f)
+                    with csv_lock, atomic_csv_writer(CSV_FILE) as writer:
                         for row in incoming_rows:
                             writer.writerow(row)
+                    log_store.invalidate()
+                    model_trainer.notify()
 
                     status, response = make_response (
                         "sync_ack",
@@ -330,22 +730,102 @@ class JetsonHandler(BaseHTTPRequestHandler):
         status, response = make_response("error", {"reason": "unknown endpoint"}, code=404)
         return self._send_json(status, response)
 
+class MoodFlixServer(ThreadingHTTPServer):
+    """Serves every request on its own thread. /inference/log and /sync
+    never wait behind inference; /inference is bounded by inference_gate.
+    server_close() waits for in-flight requests to finish."""
+
+    daemon_threads = False
+    block_on_close = True
+    # listen backlog; the default of 5 resets connections during click bursts
+    request_queue_size = 64
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.active_requests = 0
+        self.last_activity = time.monotonic()
+        self._activity_lock = threading.Lock()
+
+    def finish_request(self, request, client_address):
+        with self._activity_lock:
+            self.active_requests += 1
+        try:
+            super().finish_request(request, client_address)
+        finally:
+            with self._activity_lock:
+                self.active_requests -= 1
+                self.last_activity = time.monotonic()
+
+    def idle_seconds(self):
+        with self._activity_lock:
+            if self.active_requests:
+                return 0.0
+            return time.monotonic() - self.last_activity
+
+
+def warm_up_server():
+    """Runs after the socket is bound, so the log and sync endpoints answer
+    while the model and the inference libraries load"""
+    try:
+        with startup.phase("model"):
+            model_trainer.refresh()
+        model_trainer.start()
+        if WARM_UP:
+            for name, seconds in warm_up().items():
+                startup.add(name, seconds)
+    except Exception as e:
+        # /inference still loads whatever is missing on first use
+        print(f"Warm-up failed: {e}")
+    finally:
+        startup.ready.set()
+        total = sum(startup.status()["phases"].values())
+        print(f"Startup finished in {total:.3f}s")
+
+
 def run_server():
-    server = HTTPServer((HOST, PORT), JetsonHandler)
+    with startup.phase("setup"):
+        setup()
+    with startup.phase("bind"):
+        server = MoodFlixServer((HOST, PORT), JetsonHandler)
     print(f"Server running on http://{HOST}:{PORT}")
-    server.socket.settimeout(IDLE_TIMEOUT)
+    stopping = threading.Event()
+
+    def request_shutdown(*_):
+        # shutdown() blocks until serve_forever returns, so never call it
+        # from the serving thread itself
+        if not stopping.is_set():
+            stopping.set()
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+    def watch_idle():
+        while not stopping.wait(1.0):
+            if server.idle_seconds() >= IDLE_TIMEOUT:
+                print("No Request, exiting...")
+                request_shutdown()
+
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, request_shutdown)
+    if IDLE_TIMEOUT:
+        threading.Thread(target=watch_idle, daemon=True).start()
+    threading.Thread(target=warm_up_server, name="warm-up", daemon=True).start()
 
     try:
-        while True:
-            try:
-                server.handle_request()
-            except socket.timeout:
-                print("No Request, exiting...")
-                break
+        server.serve_forever(poll_interval=0.5)
     except KeyboardInterrupt:
         pass
+    finally:
+        stopping.set()
+        print("Waiting for in-flight requests...")
+        server.server_close()
+        model_trainer.stop()
+        inference_pool.shutdown()
+        llm_cache.flush()
+        log_writer.stop()
+        log_store.close()
     
     print("Server stopped")
 
+startup.add("import", time.perf_counter() - _import_started)
+
 if __name__ == "__main__":
     run_server()
@@ -0,0 +1,102 @@
+import csv
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from logstore import LogStore, LOG_HEADER, parse_timestamp, row_digest
+
+
+def log_row(i, latitude="37.566", temperature="21.5"):
+    return [f"2025-01-01 10:00:{i:02d}", "Seoul", latitude, "126.978", "Weekday", "Weekend",
+            "Wednesday", "clear sky", temperature, "happy", "neutral", f"Movie {i}"]
+
+
+class NonStringFieldTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "user_logs.csv")
+        with open(self.path, "w", newline="") as f:
+            csv.writer(f).writerows([LOG_HEADER, log_row(0), log_row(1)])
+        self.store = LogStore(self.path)
+        self.store.summary()  # fills the digest arrays
+
+    def tearDown(self):
+        self.store.close()
+        self.dir.cleanup()
+
+    def test_digest_matches_stored_strings(self):
+        self.assertEqual(row_digest(log_row(2, latitude=37.5, temperature=None)),
+                         row_digest(log_row(2, latitude="37.5", temperature="")))
+
+    def test_append_numeric_and_none_fields(self):
+        self.store.append(log_row(2, latitude=37.5, temperature=None))
+        self.assertEqual(len(self.store), 3)
+        self.assertEqual(len(self.store._digests), len(self.store._offsets))
+        self.assertEqual(self.store.tail(1)[0][2:9:6], ["37.5", ""])
+        # the written row is recognised as present, so a retry adds nothing
+        self.assertEqual(self.store.append_missing([log_row(2, latitude=37.5, temperature=None)]), (0, 1))
+        self.assertEqual(len(self.store), 3)
+
+
+class AppendMissingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "user_logs.csv")
+        with open(self.path, "w", newline="") as f:
+            csv.writer(f).writerows([LOG_HEADER, log_row(0), log_row(1)])
+        self.store = LogStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        self.dir.cleanup()
+
+    def test_missing_rows_are_written_once_and_synced(self):
+        synced = []
+        real_fsync = os.fsync
+        os.fsync = lambda fd: synced.append(fd) or real_fsync(fd)
+        try:
+            added = self.store.append_missing([log_row(1), log_row(2), log_row(3), log_row(2), ["short"]])
+        finally:
+            os.fsync = real_fsync
+        self.assertEqual(added, (2, 3))
+        self.assertEqual(len(synced), 1)
+        self.assertEqual([row[-1] for row in self.store.tail(4)], ["Movie 0", "Movie 1", "Movie 2", "Movie 3"])
+        # the digest set follows later appends
+        self.store.append(log_row(4))
+        self.assertEqual(self.store.append_missing([log_row(4)]), (0, 1))
+        self.assertEqual(len(self.store._digest_set), len(self.store))
+
+
+class QueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "user_logs.csv")
+        with open(self.path, "w", newline="") as f:
+            csv.writer(f).writerows([LOG_HEADER] + [log_row(i) for i in range(5)])
+        self.store = LogStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        self.dir.cleanup()
+
+    def test_timestamp_forms(self):
+        self.assertEqual(parse_timestamp("2025-10-01T12:00:00Z"), datetime(2025, 10, 1, 12))
+        self.assertEqual(parse_timestamp("2025-11-09 05:26:11.37"), datetime(2025, 11, 9, 5, 26, 11, 370000))
+        self.assertEqual(parse_timestamp("2025-10-01T21:00:00.1234567+09:00"), datetime(2025, 10, 1, 12, 0, 0, 123456))
+        self.assertIsNone(parse_timestamp("yesterday"))
+
+    def test_zero_limit_returns_every_row(self):
+        self.assertEqual(len(self.store.query(0)), 5)
+        self.assertEqual(len(self.store.query(0, mood="happy")), 5)
+        since = parse_timestamp("2025-01-01T10:00:03Z")
+        self.assertEqual([row[-1] for row in self.store.query(0, since=since)], ["Movie 3", "Movie 4"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from model_trainer import ModelTrainer
+
+
+class FakeClock:
+    """Monotonic time that only moves when a wait on FakeStopEvent times out"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeStopEvent(threading.Event):
+    """A stop event whose timed waits return at once, advancing the clock"""
+
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+
+    def wait(self, timeout=None):
+        if timeout is not None and not self.is_set():
+            self.clock.now += timeout
+        return self.is_set()
+
+
+class RetrainDebounceTest(unittest.TestCase):
+
+    def test_burst_of_notifications_retrains_once_per_min_interval(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "user_logs.csv")
+            with open(path, "w") as f:
+                f.write("header\n")
+            clock = FakeClock()
+            trainer = ModelTrainer(path, poll_interval=3600.0, min_interval=30.0, clock=clock)
+            trainer._stop = FakeStopEvent(clock)
+            runs = []
+            refreshed = threading.Semaphore(0)
+
+            def refresh(force=False):
+                runs.append(clock())
+                trainer._last_refresh = clock()
+                refreshed.release()
+                return True
+
+            trainer.refresh = refresh
+            trainer._last_refresh = clock()
+            # the burst lands before the trainer thread looks at it
+            for _ in range(40):
+                trainer.notify()
+            trainer.start()
+            try:
+                self.assertTrue(refreshed.acquire(timeout=10))
+                trainer.notify()
+                self.assertTrue(refreshed.acquire(timeout=10))
+            finally:
+                trainer.stop()
+
+            self.assertEqual(runs, [1030.0, 1060.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from recommendation_cache import RecommendationCache
+
+
+class PersistenceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "llm_cache.json")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, text):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def test_malformed_entries_are_skipped(self):
+        later = time.time() + 60
+        self.write(json.dumps([["good", later, ["Minari"]], ["short", later], 7, ["bad", "soon", ["Mother"]],
+                               ["bad titles", later, "Mother"]]))
+        cache = RecommendationCache(path=self.path)
+        self.assertEqual(cache.stats()["size"], 1)
+        self.assertEqual(cache.get("good"), ["Minari"])
+
+    def test_truncated_or_wrong_file_starts_empty(self):
+        for text in ('[["key", 1e12, ["Mino', '{"key": 1}'):
+            self.write(text)
+            self.assertEqual(RecommendationCache(path=self.path).stats()["size"], 0)
+
+    def test_put_saves_off_the_request_path(self):
+        cache = RecommendationCache(path=self.path, save_interval=3600)
+        cache.put("a", ["Minari"])
+        cache.put("b", ["Mother"])
+        self.assertFalse(os.path.exists(self.path))
+        cache.flush()
+        self.assertEqual(RecommendationCache(path=self.path).get("b"), ["Mother"])
+        # nothing pending: a second flush leaves the file alone
+        os.remove(self.path)
+        cache.flush()
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == "__main__":
+    unittest.main()